@@ -1,266 +1,969 @@
-Yes, the script requires the following dependencies:
+"""
+List the fields and their types in Elasticsearch indices, and read the documents in them.
 
+Requires Python 3.6 or later and the Elasticsearch Python client, matching the cluster's major
+version:
 
----
+    pip install elasticsearch==7.17.0    # elasticsearch==6.x.x for an Elasticsearch 6.x cluster
 
-Dependencies
+Usage:
 
-1. Python Version:
+    python Listfields.py fields http://localhost:9200 'dubber_pilot_*_audit_types' testing_alert_audit_types
+    python Listfields.py fields https://es:9200 '*_audit_types' --user elastic --json > fields.json
 
-The script is compatible with Python 3.6 or later.
+    python Listfields.py fields https://es:9200 '*_audit_types' --cache fields.db
+    python Listfields.py find --cache fields.db 'user*' --type keyword
 
+    python Listfields.py docs https://es:9200 my_index --source message_id,@timestamp > docs.jsonl
+    python Listfields.py duplicates https://es:9200 '*_message_types' --field message_id --min-count 2 --samples 3 > dups.jsonl
+    python Listfields.py search https://es:9200 rvenkat '*_audit_types' --all > hits.jsonl
+    python Listfields.py search https://es:9200 --query '{"term": {"user": "rvenkat"}}' '*_audit_types'
 
+"fields" is the default command, so "python Listfields.py HOST INDEX..." still lists fields.
 
-2. Elasticsearch Python Client:
+The password is read from the ES_PASSWORD environment variable (or prompted for) rather than
+taken on the command line.
 
-The script uses the elasticsearch library to interact with the Elasticsearch cluster.
+With --cache, flattened fields are kept in a SQLite file per cluster and index, along with a
+fingerprint of the index's mapping. Later runs ask the cluster for the fingerprints only and
+download the mappings that changed; "find" answers field lookups from the cache without a cluster.
 
-Install it using pip:
+"docs" streams every document of an index as JSON lines, however large the index: pages are read
+through a point in time with search_after (or a scroll on clusters before 7.10), with the next
+page fetched while the current one is written.
 
-pip install elasticsearch==7.17.0
+"duplicates" finds keys (e.g. message_id) that occur at least --min-count times, counting them in
+the cluster with a composite terms aggregation rather than downloading documents. Indices are
+scanned in parallel and each duplicate is written as a JSON line as soon as it is found.
 
-Replace 7.17.0 with the appropriate version compatible with your Elasticsearch cluster. For example:
+"search" runs a text (multi_match over all fields) or query DSL search on many indices at once,
+and writes hits as JSON lines in the order they arrive, with per-index hit counts and latencies
+on stderr. The first argument after the host is the text and the rest are indices; with --query,
+every one is an index. Without indices it searches the audit indices that
+Elastic/search_es_indices.txt searched one by one.
 
-Use elasticsearch==6.x.x for Elasticsearch 6.x.
+Example: for an index with the mapping
 
-Use elasticsearch==7.x.x for Elasticsearch 7.x.
+    {"properties": {"name": {"type": "text"}, "age": {"type": "integer"},
+                    "address": {"type": "object", "properties": {"street": {"type": "text"}}}}}
 
+the output is
 
+    Fields in the index 'your_index_name':
+    name: text
+    age: integer
+    address.street: text
+"""
+import argparse
+import getpass
+import hashlib
+import json
+import os
+import pathlib
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import Elasticsearch, NotFoundError, TransportError
+
+# Index names per _mapping request, so the request line stays well under proxy URL limits
+MAX_URL_CHARS = 3000
+
+# Default indices for the search command
+AUDIT_INDICES = (
+    "dubber_pilot_profiles_audit_types",
+    "dubber_pilot_alert_audit_types",
+    "swap_talk_alert_audit_types",
+    "testing_profiles_audit_types",
+    "testing_alert_audit_types",
+    "dummy_profiles_audit_types",
+    "dummy_alert_audit_types",
+    "dstesting_profiles_audit_types",
+    "dstesting_alert_audit_types",
+    "ecomm_production_20200929_profiles_audit_types",
+    "ecomm_production_20200929_alert_audit_types",
+    "ecomm_production_20230309_profiles_audit_types",
+    "ecomm_production_20230309_alert_audit_types",
+)
+
+
+def make_client(es_host, username=None, password=None, max_connections=8, timeout=30, verify_certs=True):
+    """
+    Creates one Elasticsearch client for a whole run. The client keeps a pool of keep-alive
+    connections, so every request made through it (from any thread) reuses them.
+    :param es_host: Elasticsearch host URL
+    :param username: User for basic auth, if the cluster needs it
+    :param password: Password for basic auth
+    :param max_connections: Size of the connection pool; at least the number of worker threads
+    :param timeout: Request timeout in seconds
+    :param verify_certs: Whether to verify the cluster's TLS certificate
+    :return: Elasticsearch client
+    """
+    options = {"maxsize": max_connections, "timeout": timeout, "verify_certs": verify_certs}
+    if username:
+        options["http_auth"] = (username, password or "")
+    return Elasticsearch([es_host], **options)
 
 
+def chunk_index_names(indices, max_chars=None):
+    """
+    Splits index names into comma-joined groups of at most max_chars characters.
+    :param indices: Index names or wildcard patterns
+    :param max_chars: Longest comma-joined group (default: MAX_URL_CHARS)
+    :return: List of lists of names
+    """
+    max_chars = max_chars or MAX_URL_CHARS
+    chunks = []
+    chunk = []
+    length = 0
+    for name in indices:
+        if chunk and length + len(name) + 1 > max_chars:
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+        chunk.append(name)
+        length += len(name) + 1
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def fetch_mappings(es, indices, max_workers=8):
+    """
+    Fetches the mappings of many indices. All of them are asked for in one _mapping request when
+    the names fit in one request line; longer lists are split and the requests run in parallel on
+    up to max_workers threads sharing the client's connection pool. If a multi-index request
+    fails, its indices are retried one by one so a single bad index doesn't hide the others.
+    :param es: Elasticsearch client (see make_client)
+    :param indices: Index name, wildcard pattern, or a list of them
+    :param max_workers: Most requests in flight at once
+    :return: (mappings, errors): index name -> mapping body as returned by _mapping, and index
+             name -> error message for indices that were missing or failed
+    """
+    if isinstance(indices, str):
+        indices = [indices]
+    mappings = {}
+    errors = {}
+
+    def fetch(names):
+        try:
+            return es.indices.get_mapping(index=",".join(names), ignore_unavailable=True, allow_no_indices=True), None
+        except NotFoundError as e:
+            return {}, e
+        except TransportError as e:
+            if len(names) == 1:
+                return {}, e
+            return None, e
+
+    chunks = chunk_index_names(indices)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        retry = []
+        for names, (result, error) in zip(chunks, pool.map(fetch, chunks)):
+            if result is None:
+                retry.extend(names)
+                continue
+            mappings.update(result)
+            if error is not None:
+                for name in names:
+                    errors[name] = str(error)
+        for name, (result, error) in zip(retry, pool.map(fetch, [[name] for name in retry])):
+            mappings.update(result or {})
+            if error is not None:
+                errors[name] = str(error)
+
+    # Concrete names that didn't come back don't exist (wildcards may legitimately match nothing)
+    for name in indices:
+        if name not in mappings and name not in errors and not any(char in name for char in "*?,"):
+            errors[name] = "index not found"
+    return mappings, errors
+
+
+def cluster_id(es, es_host=None):
+    """
+    Identifies the cluster behind a client, so cached fields from different clusters don't mix.
+    :param es: Elasticsearch client
+    :param es_host: Fallback when the cluster doesn't report a UUID
+    :return: The cluster UUID, or es_host, or "default" without either
+    """
+    try:
+        return es.info().get("cluster_uuid") or es_host or "default"
+    except TransportError:
+        return es_host or "default"
 
 
+def mapping_fingerprints(es, indices):
+    """
+    Cheap change detection: the index UUID and mapping_version of each index, from the cluster
+    state metadata with everything else filtered out, so no mapping is downloaded. The
+    mapping_version goes up whenever the index mapping changes.
+    :param es: Elasticsearch client
+    :param indices: Index names or wildcard patterns
+    :return: Index name -> fingerprint, or None if the cluster doesn't report mapping versions
+             (before 7.0) or the user may not read the cluster state
+    """
+    fingerprints = {}
+    for names in chunk_index_names(indices):
+        try:
+            state = es.cluster.state(
+                metric="metadata",
+                index=",".join(names),
+                filter_path="metadata.indices.*.mapping_version,metadata.indices.*.settings.index.uuid",
+                ignore_unavailable=True,
+                allow_no_indices=True,
+            )
+        except TransportError:
+            return None
+        for index, metadata in state.get("metadata", {}).get("indices", {}).items():
+            if "mapping_version" not in metadata:
+                return None
+            uuid = metadata.get("settings", {}).get("index", {}).get("uuid", "")
+            fingerprints[index] = f"{uuid}:{metadata['mapping_version']}"
+    return fingerprints
+
+
+def content_fingerprint(mapping):
+    """
+    Fingerprint of a downloaded mapping, for clusters without mapping versions.
+    :param mapping: Mapping body of one index
+    :return: Hex digest of the canonical JSON
+    """
+    return hashlib.sha1(json.dumps(mapping, sort_keys=True).encode("utf-8")).hexdigest()
 
----
-
-How to Install Dependencies
-
-Run the following command to install the elasticsearch library:
-
-pip install elasticsearch
-
-
----
-
-How to Check Python and Library Versions
-
-1. Check Python Version:
-
-python3.6 --version
-
-Ensure the version is 3.6 or later.
-
-
-2. Check Installed Elasticsearch Library Version:
-
-pip show elasticsearch
-
-Output:
-
-Name: elasticsearch
-Version: 7.17.0
-Location: /your/python/site-packages
-
-
-
-
----
-
-No Additional Dependencies
-
-The script does not require any other libraries beyond Python and the elasticsearch library.
-
-
-
----
-
-Optional Tools
-
-If you want to export the fields to a file (e.g., JSON), the built-in json library is used, which is part of Python’s standard library and does not require installation.
-
-Let me know if you encounter any issues while setting up!
-
-
-#----
-
-Below is a Python script that lists all fields and their types from a specific Elasticsearch index. This script uses Python 3.6 and the elasticsearch library.
-
-
----
-
-Python Script: List All Fields and Types
-
-from elasticsearch import Elasticsearch
 
-def list_index_fields(es_host, index_name):
+class FieldCache:
     """
-    Connects to Elasticsearch and lists all fields and their types in the given index.
-    :param es_host: Elasticsearch host URL
-    :param index_name: Index name to query
+    SQLite cache of flattened index fields, keyed by cluster and index, with the fingerprint of
+    the mapping they were read from.
     """
-    try:
-        # Connect to Elasticsearch
-        es = Elasticsearch([es_host])
-        if not es.ping():
-            print(f"Unable to connect to Elasticsearch at {es_host}")
+
+    def __init__(self, path="listfields_cache.db", read_only=False):
+        """
+        :param path: SQLite file; created if missing
+        :param read_only: Only look fields up; the file must exist (sqlite3.OperationalError if not)
+        """
+        if read_only:
+            self.conn = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
             return
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS mappings (cluster TEXT NOT NULL, index_name TEXT NOT NULL, "
+                "fingerprint TEXT NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (cluster, index_name))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fields (cluster TEXT NOT NULL, index_name TEXT NOT NULL, "
+                "field TEXT NOT NULL, type TEXT NOT NULL, PRIMARY KEY (cluster, index_name, field))"
+            )
+            # Field lookups across every index go through this instead of scanning the table
+            self.conn.execute("CREATE INDEX IF NOT EXISTS fields_by_name ON fields (field, type)")
+
+    def fingerprints(self, cluster):
+        """
+        :param cluster: Cluster id (see cluster_id)
+        :return: Index name -> fingerprint of the cached fields
+        """
+        return dict(self.conn.execute("SELECT index_name, fingerprint FROM mappings WHERE cluster = ?", (cluster,)))
+
+    def store(self, cluster, index, fingerprint, fields):
+        """
+        Replaces the cached fields of one index.
+        :param cluster: Cluster id
+        :param index: Index name
+        :param fingerprint: Fingerprint of the mapping the fields come from
+        :param fields: {field: type}
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM fields WHERE cluster = ? AND index_name = ?", (cluster, index))
+            self.conn.executemany(
+                "INSERT INTO fields (cluster, index_name, field, type) VALUES (?, ?, ?, ?)",
+                [(cluster, index, field, field_type) for field, field_type in fields.items()],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO mappings (cluster, index_name, fingerprint, fetched_at) VALUES (?, ?, ?, ?)",
+                (cluster, index, fingerprint, time.time()),
+            )
+
+    def forget(self, cluster, indices):
+        """
+        Drops cached indices, e.g. ones that no longer exist.
+        :param cluster: Cluster id
+        :param indices: Index names
+        """
+        with self.conn:
+            for index in indices:
+                self.conn.execute("DELETE FROM fields WHERE cluster = ? AND index_name = ?", (cluster, index))
+                self.conn.execute("DELETE FROM mappings WHERE cluster = ? AND index_name = ?", (cluster, index))
+
+    def fields(self, cluster, index):
+        """
+        :param cluster: Cluster id
+        :param index: Index name
+        :return: {field: type} as cached
+        """
+        return dict(self.conn.execute(
+            "SELECT field, type FROM fields WHERE cluster = ? AND index_name = ? ORDER BY rowid", (cluster, index)
+        ))
+
+    def find(self, field, field_type=None, cluster=None):
+        """
+        Which cached indices contain a field, offline.
+        :param field: Field path; * and ? match like shell wildcards (name.* for sub-fields)
+        :param field_type: Only fields of this type
+        :param cluster: Only this cluster
+        :return: List of (cluster, index, field, type)
+        """
+        query = "SELECT cluster, index_name, field, type FROM fields WHERE "
+        query += "field GLOB ?" if any(char in field for char in "*?[") else "field = ?"
+        args = [field]
+        if field_type:
+            query += " AND type = ?"
+            args.append(field_type)
+        if cluster:
+            query += " AND cluster = ?"
+            args.append(cluster)
+        return self.conn.execute(query + " ORDER BY cluster, index_name, field", args).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def cached_inventory(es, cache, indices, max_workers=8, es_host=None, refresh=False):
+    """
+    Field inventory served from the cache, downloading only the mappings that changed.
+    :param es: Elasticsearch client
+    :param cache: FieldCache
+    :param indices: Index name, wildcard pattern, or a list of them
+    :param max_workers: Most mapping requests in flight at once
+    :param es_host: Fallback cluster id (see cluster_id)
+    :param refresh: Download every mapping regardless of fingerprints
+    :return: (inventory, errors, refetched): index name -> {field: type}, index name -> error
+             message, and the names of the indices whose mappings were downloaded
+    """
+    if isinstance(indices, str):
+        indices = [indices]
+    cluster = cluster_id(es, es_host)
+    cached = cache.fingerprints(cluster)
+    current = mapping_fingerprints(es, indices)
+    if current is None:
+        # No mapping versions: download everything, but only re-store mappings whose content changed
+        mappings, errors = fetch_mappings(es, indices, max_workers)
+        current = {index: content_fingerprint(mapping) for index, mapping in mappings.items()}
+        stale = [index for index in mappings if refresh or cached.get(index) != current[index]]
+    else:
+        stale = [index for index in current if refresh or cached.get(index) != current[index]]
+        mappings, errors = fetch_mappings(es, stale, max_workers) if stale else ({}, {})
+        for name in indices:
+            if name not in current and not any(char in name for char in "*?,"):
+                errors.setdefault(name, "index not found")
+    for index, fields in field_inventory({index: mappings[index] for index in stale if index in mappings}).items():
+        cache.store(cluster, index, current[index], fields)
+    cache.forget(cluster, [name for name in indices if errors.get(name) == "index not found" and name in cached])
+    inventory = {index: cache.fields(cluster, index) for index in sorted(current) if index not in errors}
+    return inventory, errors, [index for index in stale if index in mappings]
+
+
+def iter_fields(properties, parent_key=''):
+    """
+    Streams every field of a mapping as (path, type, attributes), depth first in mapping order.
+    Iterative, so arbitrarily deep mappings don't hit the recursion limit, and nothing is copied:
+    attributes is the field's own definition from the mapping (ignore_above, analyzer, ...).
+    Object and nested fields are yielded before their sub-fields with type "object" or "nested";
+    multi-fields (e.g. "fields": {"keyword": ...}) follow their parent as path.keyword.
+    :param properties: Properties section of the mapping
+    :param parent_key: Path prefix for the fields
+    :return: Generator of (path, type, attributes)
+    """
+    # Each stack entry is the path prefix (with its trailing dot) and the position in its properties
+    stack = [(f"{parent_key}." if parent_key else "", iter(properties.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, value in items:
+            path = prefix + key
+            # Fields without a type are objects, whether or not they have properties yet
+            yield path, value.get("type", "object"), value
+            children = value.get("properties")
+            if children is not None:
+                stack.append((path + ".", iter(children.items())))
+                break
+            sub_fields = value.get("fields")
+            if sub_fields:
+                path += "."
+                for sub_key, sub_value in sub_fields.items():
+                    yield path + sub_key, sub_value.get("type", "object"), sub_value
+        else:
+            stack.pop()
 
-        # Get the mapping of the index
-        mapping = es.indices.get_mapping(index=index_name)
 
-        # Parse the mapping to extract fields and their types
-        print(f"\nFields in the index '{index_name}':")
-        fields = extract_fields(mapping[index_name]["mappings"]["properties"])
-        for field, field_type in fields.items():
-            print(f"{field}: {field_type}")
-
-    except Exception as e:
-        print(f"Error: {e}")
+def mapping_properties(mapping):
+    """
+    Properties sections of an index mapping as returned by _mapping. ES 6 style typed mappings
+    ({"mappings": {"_doc": {"properties": ...}}}) have one per type.
+    :param mapping: Mapping body of one index
+    :return: List of properties dicts
+    """
+    mappings = mapping.get("mappings", mapping)
+    if "properties" in mappings:
+        return [mappings["properties"]]
+    return [body["properties"] for body in mappings.values() if isinstance(body, dict) and "properties" in body]
 
 
 def extract_fields(properties, parent_key=''):
     """
-    Recursively extracts fields and their types from the mapping.
+    Extracts leaf fields and their types from the mapping, including multi-fields; objects with
+    sub-fields are left out, the same as before iter_fields.
     :param properties: Properties section of the mapping
     :param parent_key: Parent key for nested fields
     :return: Dictionary of fields and their types
     """
-    fields = {}
-    for key, value in properties.items():
-        field_name = f"{parent_key}.{key}" if parent_key else key
-        if "properties" in value:
-            # Handle nested fields
-            fields.update(extract_fields(value["properties"], field_name))
-        else:
-            fields[field_name] = value.get("type", "object/nested")
-    return fields
-
-
-if __name__ == "__main__":
-    # Hardcoded Elasticsearch host and index name
-    es_host = "http://localhost:9200"
-    index_name = "your_index_name"
-
-    # List fields in the specified index
-    list_index_fields(es_host, index_name)
-
-
----
-
-How It Works
-
-1. Connect to Elasticsearch:
-
-The script connects to an Elasticsearch cluster using the provided host URL (es_host).
-
-
-
-2. Fetch Index Mapping:
-
-It retrieves the mapping of the specified index (index_name) to understand its data structure.
-
-
-
-3. Recursive Field Extraction:
-
-The extract_fields function parses the mapping to extract all fields, including nested fields, along with their data types.
+    return {path: field_type for path, field_type, attributes in iter_fields(properties, parent_key) if "properties" not in attributes}
 
 
+def field_inventory(mappings):
+    """
+    Flattens fetched mappings into a per-index field inventory.
+    :param mappings: Index name -> mapping body, as returned by fetch_mappings
+    :return: Index name -> {field: type}, in index name order
+    """
+    inventory = {}
+    for index in sorted(mappings):
+        fields = inventory[index] = {}
+        for properties in mapping_properties(mappings[index]):
+            fields.update(extract_fields(properties))
+    return inventory
 
-4. Output:
 
-Prints a list of all fields and their corresponding types in the specified index.
+def pit_pages(es, index, body, page_size, keep_alive):
+    """
+    Pages of hits read through a point in time with search_after, sorted by _shard_doc.
+    The point in time is closed when the generator finishes or is closed.
+    :param es: Elasticsearch client
+    :param index: Index name or pattern
+    :param body: Search body without size, sort or pagination (query, _source, ...)
+    :param page_size: Hits per page
+    :param keep_alive: How long the point in time lives between pages, e.g. "2m"
+    :return: Generator of lists of hits
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+    try:
+        body = dict(body, size=page_size, sort=[{"_shard_doc": "asc"}], track_total_hits=False)
+        while True:
+            body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+            response = es.search(body=body)
+            # The cluster may hand back a new id for the same point in time
+            pit_id = response.get("pit_id", pit_id)
+            hits = response["hits"]["hits"]
+            if hits:
+                yield hits
+            if len(hits) < page_size:
+                return
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(body={"id": pit_id})
+        except TransportError:
+            pass
+
+
+def scroll_pages(es, index, body, page_size, keep_alive):
+    """
+    Pages of hits read with the scroll API, for clusters without point in time (before 7.10).
+    The scroll is cleared when the generator finishes or is closed.
+    :param es: Elasticsearch client
+    :param index: Index name or pattern
+    :param body: Search body without size, sort or pagination
+    :param page_size: Hits per page (per shard on some older versions)
+    :param keep_alive: How long the scroll context lives between pages
+    :return: Generator of lists of hits
+    """
+    response = es.search(index=index, body=dict(body, sort=["_doc"]), scroll=keep_alive, size=page_size)
+    scroll_id = response.get("_scroll_id")
+    try:
+        while response["hits"]["hits"]:
+            yield response["hits"]["hits"]
+            response = es.scroll(body={"scroll_id": scroll_id, "scroll": keep_alive})
+            scroll_id = response.get("_scroll_id", scroll_id)
+    finally:
+        if scroll_id:
+            try:
+                es.clear_scroll(body={"scroll_id": [scroll_id]})
+            except TransportError:
+                pass
+
+
+def document_pages(es, index, body, page_size, keep_alive):
+    """
+    Pages of every hit of a search, through a point in time where the cluster supports it and a
+    scroll otherwise.
+    :return: Generator of lists of hits
+    """
+    try:
+        pages = pit_pages(es, index, body, page_size, keep_alive)
+        first = next(pages, None)
+    except TransportError as e:
+        # 400/404/405: the cluster (or a proxy in front of it) doesn't know _pit
+        if e.status_code not in (400, 404, 405):
+            raise
+        yield from scroll_pages(es, index, body, page_size, keep_alive)
+        return
+    if first is None:
+        return
+    yield first
+    yield from pages
+
+
+def put_until_stopped(items, item, stop):
+    """
+    Puts an item on a bounded queue, giving up once stop is set so a producer thread can't stay
+    blocked after its consumer has gone away.
+    :return: Whether the item was queued
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
 
 
+def prefetched(pages, depth):
+    """
+    Runs a page generator on a background thread, up to depth pages ahead of the caller, so the
+    next request is in flight while the current page is being processed. Memory stays bounded by
+    depth + 1 pages. Closing the returned generator stops the thread and closes `pages`.
+    :param pages: Generator of pages
+    :param depth: Most pages fetched but not yet taken by the caller
+    :return: Generator of the same pages
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for page in pages:
+                if not put_until_stopped(ready, (page, None), stop):
+                    break
+            item = (done, None)
+        except Exception as e:
+            item = (done, e)
+        finally:
+            pages.close()
+        put_until_stopped(ready, item, stop)
+
+    thread = threading.Thread(target=produce, name="Listfields-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            page, error = ready.get()
+            if page is done:
+                if error is not None:
+                    raise error
+                return
+            yield page
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_documents(es, index, query=None, source=None, page_size=1000, prefetch=1, keep_alive="2m"):
+    """
+    Streams every hit of an index (or pattern) matching a query, without the 10,000 hit cap of a
+    plain search. Memory use depends on page_size and prefetch only, not on the index size.
+    :param es: Elasticsearch client
+    :param index: Index name or pattern
+    :param query: Query DSL, match_all by default
+    :param source: _source filter: a list of fields, False for none, or {"includes": ..., "excludes": ...}
+    :param page_size: Hits per request
+    :param prefetch: Pages fetched ahead on a background thread; 0 fetches on demand
+    :param keep_alive: How long the cluster keeps the point in time (or scroll) between requests
+    :return: Generator of hits ({"_index", "_id", "_source", ...})
+    """
+    body = {"query": query or {"match_all": {}}}
+    if source is not None:
+        body["_source"] = source
+    pages = document_pages(es, index, body, page_size, keep_alive)
+    if prefetch > 0:
+        pages = prefetched(pages, prefetch)
+    try:
+        for page in pages:
+            yield from page
+    finally:
+        pages.close()
 
 
+def resolve_indices(es, indices):
+    """
+    Concrete index names behind names, aliases and wildcard patterns, without fetching mappings.
+    :param es: Elasticsearch client
+    :param indices: Index name, alias, wildcard pattern, or a list of them
+    :return: Sorted list of index names
+    """
+    if isinstance(indices, str):
+        indices = [indices]
+    names = set()
+    for chunk in chunk_index_names(indices):
+        names.update(es.indices.get_alias(index=",".join(chunk), ignore_unavailable=True, allow_no_indices=True))
+    return sorted(names)
 
----
 
-Example Output
+def key_filter(fields, key):
+    """
+    Query matching the documents of one composite key.
+    """
+    return {"bool": {"filter": [{"term": {field: key[field]}} for field in fields]}}
 
-For an index with the following mapping:
 
-{
-  "your_index_name": {
-    "mappings": {
-      "properties": {
-        "name": { "type": "text" },
-        "age": { "type": "integer" },
-        "address": {
-          "type": "object",
-          "properties": {
-            "street": { "type": "text" },
-            "city": { "type": "text" }
-          }
-        }
-      }
+def sample_ids(es, index, fields, keys, samples, query=None):
+    """
+    Up to `samples` document ids for each of a page of keys, in one request: a composite
+    aggregation over just those keys with a top_hits sub-aggregation.
+    :return: Tuple of key values -> list of ids
+    """
+    body = {
+        "size": 0,
+        "query": {"bool": {
+            "filter": [query or {"match_all": {}}],
+            "should": [key_filter(fields, key) for key in keys],
+            "minimum_should_match": 1,
+        }},
+        "aggs": {"keys": {
+            "composite": {"size": len(keys), "sources": [{field: {"terms": {"field": field}}} for field in fields]},
+            "aggs": {"ids": {"top_hits": {"size": samples, "_source": False}}},
+        }},
+    }
+    response = es.search(index=index, body=body)
+    return {
+        tuple(bucket["key"][field] for field in fields): [hit["_id"] for hit in bucket["ids"]["hits"]["hits"]]
+        for bucket in response.get("aggregations", {}).get("keys", {}).get("buckets", [])
     }
-  }
-}
-
-The script will output:
-
-Fields in the index 'your_index_name':
-name: text
-age: integer
-address.street: text
-address.city: text
-
-
----
-
-Features
-
-1. Recursive Parsing:
-
-Handles nested and object fields gracefully, appending parent keys to nested field names.
-
-
-
-2. Dynamic Output:
-
-Adapts to any index structure, listing all fields and their data types.
-
-
-
-3. Ready for Queries:
-
-The field names can be directly used in Elasticsearch queries.
-
-
-
-
-
----
-
-Run the Script
-
-1. Save the script as list_index_fields.py.
-
 
-2. Replace your_index_name with the name of your Elasticsearch index.
 
+def duplicate_keys(es, index, fields, min_count=2, page_size=1000, samples=0, query=None):
+    """
+    Keys occurring in at least min_count documents of an index, counted by the cluster: a
+    composite terms aggregation is paged through with after_key and only the keys and their
+    counts come back (composite has no min_doc_count, so the filter is applied to each page here).
+    :param es: Elasticsearch client
+    :param index: Index name
+    :param fields: Field (keyword, numeric, ...) or list of fields making up the key
+    :param min_count: Smallest number of documents for a key to be reported
+    :param page_size: Keys per request
+    :param samples: Document ids to include per duplicate key (one extra request per page with duplicates)
+    :param query: Only count documents matching this query
+    :return: Generator of {"index", "key", "count"[, "ids"]}; key is the value, or a dict for several fields
+    """
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    composite = {"size": page_size, "sources": [{field: {"terms": {"field": field}}} for field in fields]}
+    body = {"size": 0, "track_total_hits": False, "query": query or {"match_all": {}}, "aggs": {"keys": {"composite": composite}}}
+    while True:
+        response = es.search(
+            index=index,
+            body=body,
+            filter_path="aggregations.keys.after_key,aggregations.keys.buckets.key,aggregations.keys.buckets.doc_count",
+        )
+        result = response.get("aggregations", {}).get("keys", {})
+        buckets = result.get("buckets", [])
+        found = [bucket for bucket in buckets if bucket["doc_count"] >= min_count]
+        ids = sample_ids(es, index, fields, [bucket["key"] for bucket in found], samples, query) if samples and found else {}
+        for bucket in found:
+            key = bucket["key"]
+            record = {"index": index, "key": key[fields[0]] if len(fields) == 1 else key, "count": bucket["doc_count"]}
+            if samples:
+                record["ids"] = ids.get(tuple(key[field] for field in fields), [])
+            yield record
+        if "after_key" not in result or len(buckets) < page_size:
+            return
+        composite["after"] = result["after_key"]
 
-3. Run the script:
 
-python3.6 list_index_fields.py
+def parallel_records(names, produce, max_workers=4, stats=None):
+    """
+    Runs produce(index, summary) for many indices on a bounded thread pool and yields the records
+    it generates as they arrive from any index, so total time follows the slowest index rather
+    than the sum. Workers share the caller's client and so its keep-alive connection pool.
+    :param names: Index names
+    :param produce: Generator function of (index, summary dict); it may add its own counters to summary
+    :param max_workers: Indices worked on at once
+    :param stats: Optional dict filled with index name -> summary: "count" of records and "seconds",
+                  plus "error" if produce raised for the index (whatever the exception)
+    :return: Generator of records
+    """
+    stats = {} if stats is None else stats
+    results = queue.Queue(maxsize=10000)
+    stop = threading.Event()
+    finished = object()
+
+    def work(index):
+        if stop.is_set():
+            # The consumer is gone; indices still waiting for a worker aren't started
+            return
+        started = time.perf_counter()
+        summary = stats[index] = {"count": 0}
+        try:
+            for record in produce(index, summary):
+                if not put_until_stopped(results, record, stop):
+                    return
+                summary["count"] += 1
+        except Exception as e:
+            # Any failure, not only the cluster's (a malformed response, a serialization error),
+            # marks the index as failed rather than leaving a partial count looking complete
+            summary["error"] = str(e) if isinstance(e, TransportError) else f"{type(e).__name__}: {e}"
+        finally:
+            summary["seconds"] = round(time.perf_counter() - started, 3)
+            put_until_stopped(results, finished, stop)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names) or 1)))
+    try:
+        for index in names:
+            pool.submit(work, index)
+        remaining = len(names)
+        while remaining:
+            record = results.get()
+            if record is finished:
+                remaining -= 1
+            else:
+                yield record
+    finally:
+        stop.set()
+        pool.shutdown(wait=True)
+
+
+def find_duplicates(es, indices, fields, min_count=2, page_size=1000, samples=0, query=None, max_workers=4, stats=None):
+    """
+    duplicate_keys over many indices in parallel, yielding duplicates as soon as any index
+    produces them.
+    :param es: Elasticsearch client; its connection pool is shared by the workers
+    :param indices: Index names, aliases or wildcard patterns
+    :param max_workers: Indices scanned at once
+    :param stats: Optional dict filled with index name -> {"count", "seconds"[, "error"]}
+    :return: Generator of duplicate records (see duplicate_keys)
+    """
+    def produce(index, summary):
+        return duplicate_keys(es, index, fields, min_count, page_size, samples, query)
 
+    return parallel_records(resolve_indices(es, indices), produce, max_workers, stats)
 
 
+def text_query(text):
+    """
+    The search the audit scripts ran: the text matched against every field.
+    """
+    return {"multi_match": {"query": text, "type": "best_fields", "fields": ["*"]}}
 
----
 
-Next Steps
+def search_indices(es, indices, query, size=100, all_hits=False, source=None, max_workers=8, stats=None):
+    """
+    Runs one search on many indices in parallel and yields hits as each index answers.
+    :param es: Elasticsearch client; its connection pool is shared by the workers
+    :param indices: Index names, aliases or wildcard patterns
+    :param query: Query DSL (see text_query)
+    :param size: Best-scoring hits per index
+    :param all_hits: Stream every matching hit of each index instead (see iter_documents)
+    :param source: _source filter, as for iter_documents
+    :param max_workers: Indices searched at once
+    :param stats: Optional dict filled with index name -> {"count", "seconds", "total", "took_ms"[, "error"]}
+    :return: Generator of hits ({"_index", "_id", "_score", "_source", ...})
+    """
+    def produce(index, summary):
+        if all_hits:
+            return iter_documents(es, index, query, source, prefetch=1)
+        body = {"query": query, "size": size, "track_total_hits": True}
+        if source is not None:
+            body["_source"] = source
+        response = es.search(index=index, body=body)
+        total = response["hits"].get("total", 0)
+        summary["total"] = total["value"] if isinstance(total, dict) else total
+        summary["took_ms"] = response.get("took")
+        return iter(response["hits"]["hits"])
+
+    return parallel_records(resolve_indices(es, indices), produce, max_workers, stats)
+
+
+def index_fields(es, indices, max_workers=8, cache=None, es_host=None, refresh=False):
+    """
+    Field inventory of the given indices, through the cache when there is one.
+    :param es: Elasticsearch client
+    :param indices: Index name, wildcard pattern, or a list of them
+    :param max_workers: Most mapping requests in flight at once
+    :param cache: FieldCache, or None to always download the mappings
+    :param es_host: Fallback cluster id for the cache (see cluster_id)
+    :param refresh: With a cache, download every mapping regardless of fingerprints
+    :return: (inventory, errors): index name -> {field: type}, index name -> error message
+    """
+    if cache is None:
+        mappings, errors = fetch_mappings(es, indices, max_workers)
+        return field_inventory(mappings), errors
+    inventory, errors, _ = cached_inventory(es, cache, indices, max_workers, es_host, refresh)
+    return inventory, errors
 
-Use the field names output by this script to create custom queries for analyzing or visualizing data.
 
-If the index has many fields, consider exporting the results to a JSON file for easier analysis. For example:
+def list_index_fields(es_host, index_name, es=None, max_workers=8, cache=None, refresh=False):
+    """
+    Connects to Elasticsearch and lists all fields and their types in the given indices.
+    :param es_host: Elasticsearch host URL
+    :param index_name: Index name, wildcard pattern, or a list of them
+    :param es: Client to reuse instead of connecting to es_host
+    :param max_workers: Most mapping requests in flight at once
+    :param cache: FieldCache to serve unchanged mappings from
+    :param refresh: With a cache, download every mapping regardless of fingerprints
+    :return: Index name -> {field: type}
+    """
+    es = es or make_client(es_host, max_connections=max_workers)
+    inventory, errors = index_fields(es, index_name, max_workers, cache, es_host, refresh)
+    for index, fields in inventory.items():
+        print(f"\nFields in the index '{index}':")
+        for field, field_type in fields.items():
+            print(f"{field}: {field_type}")
+    for index, error in sorted(errors.items()):
+        print(f"Error: {index}: {error}", file=sys.stderr)
+    return inventory
 
-import json
-with open("fields.json", "w") as f:
-    json.dump(fields, f, indent=4)
 
+def connect(args):
+    """
+    Client for the host and connection options shared by every command.
+    """
+    password = None
+    if args.user:
+        password = os.environ.get("ES_PASSWORD") or getpass.getpass(f"Password for {args.user}: ")
+    return make_client(args.es_host, args.user, password, max_connections=args.workers, timeout=args.timeout, verify_certs=not args.insecure)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    commands = ("fields", "find", "docs", "duplicates", "search")
+    if argv and argv[0] not in commands and not argv[0].startswith("-"):
+        # The original command line: HOST INDEX... lists fields
+        argv.insert(0, "fields")
+
+    cluster = argparse.ArgumentParser(add_help=False)
+    cluster.add_argument("es_host", help="Elasticsearch host URL, e.g. http://localhost:9200")
+    cluster.add_argument("--user", help="basic auth user (password from ES_PASSWORD or a prompt)")
+    cluster.add_argument("--workers", type=int, default=8, help="parallel requests (default: 8)")
+    cluster.add_argument("--timeout", type=float, default=30, help="request timeout in seconds (default: 30)")
+    cluster.add_argument("--insecure", action="store_true", help="don't verify the cluster's TLS certificate")
+
+    parser = argparse.ArgumentParser(description="List the fields and their types in Elasticsearch indices, and read their documents")
+    subparsers = parser.add_subparsers(dest="command")
+    fields_parser = subparsers.add_parser("fields", parents=[cluster], help="list the fields of indices")
+    fields_parser.add_argument("indices", nargs="+", help="index names or wildcard patterns")
+    fields_parser.add_argument("--json", action="store_true", help="print the inventory as JSON")
+    fields_parser.add_argument("--cache", help="SQLite file caching fields between runs")
+    fields_parser.add_argument("--refresh", action="store_true", help="download every mapping even if the cache is up to date")
+    find_parser = subparsers.add_parser("find", help="list cached indices with a field; needs no cluster")
+    find_parser.add_argument("field", help="field path; * and ? are wildcards")
+    find_parser.add_argument("--type", help="only fields of this type")
+    find_parser.add_argument("--cache", required=True, help="SQLite file written by fields --cache")
+    find_parser.add_argument("--json", action="store_true", help="print matches as JSON")
+    docs_parser = subparsers.add_parser("docs", parents=[cluster], help="stream every document of an index as JSON lines")
+    docs_parser.add_argument("index", help="index name or pattern")
+    docs_parser.add_argument("--query", help="query DSL as JSON (default: match_all)")
+    docs_parser.add_argument("--source", help="comma-separated _source fields to return (default: all)")
+    docs_parser.add_argument("--page-size", type=int, default=1000, help="hits per request (default: 1000)")
+    docs_parser.add_argument("--prefetch", type=int, default=1, help="pages fetched ahead while writing (default: 1)")
+    duplicates_parser = subparsers.add_parser("duplicates", parents=[cluster], help="find keys occurring in several documents, as JSON lines")
+    duplicates_parser.add_argument("indices", nargs="+", help="index names or wildcard patterns")
+    duplicates_parser.add_argument("--field", action="append", required=True, help="key field; repeat for a compound key")
+    duplicates_parser.add_argument("--min-count", type=int, default=2, help="report keys in at least this many documents (default: 2)")
+    duplicates_parser.add_argument("--samples", type=int, default=0, help="document ids to include per key (default: 0)")
+    duplicates_parser.add_argument("--query", help="only count documents matching this query DSL (JSON)")
+    duplicates_parser.add_argument("--page-size", type=int, default=1000, help="keys per request (default: 1000)")
+    duplicates_parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    search_parser = subparsers.add_parser("search", parents=[cluster], help="search many indices in parallel, hits as JSON lines")
+    search_parser.add_argument(
+        "terms", nargs="*", metavar="TEXT INDEX",
+        help="text to match in any field, then index names or wildcard patterns (default: the audit indices); with --query every one is an index",
+    )
+    search_parser.add_argument("--query", help="query DSL as JSON instead of text")
+    search_parser.add_argument("--size", type=int, default=100, help="best hits per index (default: 100)")
+    search_parser.add_argument("--all", action="store_true", help="stream every matching hit instead of the best --size")
+    search_parser.add_argument("--source", help="comma-separated _source fields to return (default: all)")
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "search":
+        # argparse fills a nargs="*" positional before any option that comes ahead of it, so index
+        # names written after --query or --size are left over here
+        args.terms += [arg for arg in extra if not arg.startswith("-")]
+        extra = [arg for arg in extra if arg.startswith("-")]
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    if args.command == "search":
+        if args.query:
+            text, indices = None, args.terms
+        elif args.terms:
+            text, indices = args.terms[0], args.terms[1:]
+        else:
+            parser.error("search needs text or --query")
+        es = connect(args)
+        stats = {}
+        query = json.loads(args.query) if args.query else text_query(text)
+        source = args.source.split(",") if args.source else None
+        started = time.perf_counter()
+        for hit in search_indices(es, indices or list(AUDIT_INDICES), query, args.size, args.all, source, args.workers, stats):
+            sys.stdout.write(json.dumps(hit) + "\n")
+        for index, summary in sorted(stats.items()):
+            total = f" of {summary['total']}" if "total" in summary else ""
+            error = f" (error: {summary['error']})" if "error" in summary else ""
+            print(f"{index}: {summary['count']}{total} hits in {summary['seconds']}s{error}", file=sys.stderr)
+        print(f"{sum(summary['count'] for summary in stats.values())} hits from {len(stats)} indices in {time.perf_counter() - started:.3f}s "
+              f"(slowest index {max((summary['seconds'] for summary in stats.values()), default=0)}s)", file=sys.stderr)
+        return 1 if any("error" in summary for summary in stats.values()) else 0
+
+    if args.command == "duplicates":
+        es = connect(args)
+        stats = {}
+        query = json.loads(args.query) if args.query else None
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for record in find_duplicates(es, args.indices, args.field, args.min_count, args.page_size, args.samples, query, args.workers, stats):
+                output.write(json.dumps(record) + "\n")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        for index, summary in sorted(stats.items()):
+            print(f"{index}: {summary['count']} duplicate keys in {summary['seconds']}s" + (f" (error: {summary['error']})" if "error" in summary else ""), file=sys.stderr)
+        return 1 if any("error" in summary for summary in stats.values()) else 0
+    if args.command == "find":
+        # Read-only, so a mistyped path is reported instead of creating an empty cache
+        try:
+            rows = FieldCache(args.cache, read_only=True).find(args.field, args.type)
+        except sqlite3.Error as e:
+            print(f"Error: can't read the cache {args.cache} (written by fields --cache): {e}", file=sys.stderr)
+            return 2
+        if args.json:
+            json.dump([dict(zip(("cluster", "index", "field", "type"), row)) for row in rows], sys.stdout, indent=2)
+            print()
+        else:
+            for cluster_name, index, field, field_type in rows:
+                print(f"{index}: {field}: {field_type}")
+        return 0 if rows else 1
+    if args.command == "docs":
+        es = connect(args)
+        source = args.source.split(",") if args.source else None
+        query = json.loads(args.query) if args.query else None
+        count = 0
+        for hit in iter_documents(es, args.index, query, source, args.page_size, args.prefetch):
+            sys.stdout.write(json.dumps(hit) + "\n")
+            count += 1
+        print(f"{count} documents", file=sys.stderr)
+        return 0
+    if args.command != "fields":
+        parser.print_help()
+        return 2
+
+    es = connect(args)
+    cache = FieldCache(args.cache) if args.cache else None
+    if not args.json:
+        return 0 if list_index_fields(args.es_host, args.indices, es=es, max_workers=args.workers, cache=cache, refresh=args.refresh) else 1
+    inventory, errors = index_fields(es, args.indices, args.workers, cache, args.es_host, args.refresh)
+    json.dump({"indices": inventory, "errors": errors}, sys.stdout, indent=2)
+    print()
+    return 1 if errors and not inventory else 0
 
-Let me know if you need further enhancements!
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Microbenchmark of Listfields.iter_fields / extract_fields against the old recursive flattener on
+synthetic mappings of 10k+ fields.
+
+    python listfields_bench.py                  # all shapes, best of 5
+    python listfields_bench.py --fields 50000 --repeat 3 --json
+
+Shapes:
+    wide   - one level of text fields, each with a keyword multi-field
+    bushy  - objects nested 4 levels deep with a fan-out of 10, leaves at the bottom
+    nested - nested objects holding many small leaf groups
+    deep   - a chain of objects deeper than the recursion limit, with one leaf at each level
+"""
+import argparse
+import json
+import sys
+import time
+
+from Listfields import extract_fields, iter_fields
+
+
+def extract_fields_recursive(properties, parent_key=''):
+    # The flattener from before iter_fields, kept here as the baseline
+    fields = {}
+    for key, value in properties.items():
+        field_name = f"{parent_key}.{key}" if parent_key else key
+        if "properties" in value:
+            fields.update(extract_fields_recursive(value["properties"], field_name))
+        else:
+            fields[field_name] = value.get("type", "object/nested")
+    return fields
+
+
+def wide_mapping(count):
+    return {
+        f"field_{number}": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+        for number in range(count // 2)
+    }
+
+
+def bushy_mapping(count, fan_out=10):
+    depth = 1
+    while fan_out ** depth < count:
+        depth += 1
+
+    def level(remaining):
+        if remaining == 1:
+            return {f"leaf_{number}": {"type": "keyword"} for number in range(fan_out)}
+        return {f"obj_{number}": {"properties": level(remaining - 1)} for number in range(fan_out)}
+
+    return level(depth)
+
+
+def nested_mapping(count, group=10):
+    return {
+        f"group_{number}": {
+            "type": "nested",
+            "properties": {f"value_{leaf}": {"type": "long" if leaf % 2 else "keyword"} for leaf in range(group)},
+        }
+        for number in range(count // group)
+    }
+
+
+def deep_mapping(count):
+    # Each level holds one leaf and the next level, so paths get longer as the chain goes down
+    root = {}
+    properties = root
+    for level in range(count // 2):
+        properties["leaf"] = {"type": "keyword"}
+        child = {}
+        properties[f"level_{level}"] = {"properties": child}
+        properties = child
+    return root
+
+
+SHAPES = {"wide": wide_mapping, "bushy": bushy_mapping, "nested": nested_mapping, "deep": deep_mapping}
+
+
+def best_time(function, argument, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            result = function(argument)
+        except RecursionError:
+            return None, None
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark mapping flatteners on synthetic mappings")
+    parser.add_argument("--fields", type=int, default=20000, help="roughly how many fields per mapping (default: 20000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the best is kept (default: 5)")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help=f"comma-separated shapes from {', '.join(SHAPES)}")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for shape in args.shapes.split(","):
+        mapping = SHAPES[shape](args.fields)
+        recursive_s, recursive_fields = best_time(extract_fields_recursive, mapping, args.repeat)
+        extract_s, fields = best_time(extract_fields, mapping, args.repeat)
+        stream_s, _ = best_time(lambda properties: sum(1 for _ in iter_fields(properties)), mapping, args.repeat)
+        results[shape] = {
+            "fields": len(fields),
+            "recursive_ms": None if recursive_s is None else round(1000 * recursive_s, 2),
+            "recursive_fields": None if recursive_fields is None else len(recursive_fields),
+            "extract_fields_ms": round(1000 * extract_s, 2),
+            "iter_fields_ms": round(1000 * stream_s, 2),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'shape':<8} {'fields':>8} {'recursive ms':>13} {'extract_fields ms':>18} {'iter_fields ms':>15}")
+    for shape, row in results.items():
+        recursive = "RecursionError" if row["recursive_ms"] is None else f"{row['recursive_ms']:.2f}"
+        print(f"{shape:<8} {row['fields']:>8} {recursive:>13} {row['extract_fields_ms']:>18.2f} {row['iter_fields_ms']:>15.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,668 @@
+"""
+Tests for Listfields against StubCluster, a local HTTP server that answers the parts of the
+Elasticsearch REST API Listfields uses, so they run without a cluster:
+
+    python test_listfields.py
+    python -m pytest test_listfields.py
+"""
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import Listfields
+from elasticsearch import TransportError
+
+from Listfields import FieldCache, cached_inventory, duplicate_keys, fetch_mappings, find_duplicates, iter_documents, main, make_client
+
+
+class StubCluster:
+    """
+    In-memory stand-in for an Elasticsearch 7.17 cluster, serving indices given as
+    name -> {"mappings": {...}, "docs": [{"_id": ..., "_source": {...}}, ...], "mapping_version": n}
+    (the version defaults to 1). Every request is recorded in `requests` as (method, path, query
+    parameters, body).
+    :param indices: Index name -> index description
+    :param failing: Index names whose _mapping and aggregation requests fail with a 500
+    :param malformed: Index names whose aggregation buckets come back without a doc_count
+    :param pit: Whether _pit is supported; without it the cluster answers 405 like one before 7.10
+    :param rotate_pit: Hand back a new point in time id with every page
+    :param fail_after: Search pages served before every further page fails with a 500
+    :param delay: Seconds every search waits before answering
+    :param mapping_versions: Whether the cluster state reports mapping_version, as clusters from 7.0 do
+    """
+
+    def __init__(self, indices, failing=(), malformed=(), pit=True, rotate_pit=False, fail_after=None, delay=0, mapping_versions=True):
+        self.indices = indices
+        self.failing = set(failing)
+        self.malformed = set(malformed)
+        self.pit = pit
+        self.rotate_pit = rotate_pit
+        self.fail_after = fail_after
+        self.delay = delay
+        self.mapping_versions = mapping_versions
+        self.pages_served = 0
+        # Open contexts: point in time id -> hits, scroll id -> [hits, position, size]
+        self.pits = {}
+        self.scrolls = {}
+        self.closed_pits = []
+        self.cleared_scrolls = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.cluster = self
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def calls(self, method, endpoint):
+        """Recorded requests of one method whose path ends with endpoint."""
+        return [request for request in self.requests if request[0] == method and request[1].endswith(endpoint)]
+
+    def resolve(self, expression):
+        # Index names behind a comma-separated list of names and wildcard patterns; missing
+        # names are left out, as with ignore_unavailable
+        names = []
+        for part in expression.split(","):
+            for name in sorted(self.indices):
+                if fnmatch.fnmatchcase(name, part) and name not in names:
+                    names.append(name)
+        return names
+
+    def handle(self, method, path, params, body):
+        with self.lock:
+            self.requests.append((method, path, params, body))
+        parts = [unquote(part) for part in path.strip("/").split("/") if part]
+        if self.delay and "_search" in parts:
+            time.sleep(self.delay)
+        if method in ("GET", "HEAD") and not parts:
+            return 200, {
+                "name": "stub", "cluster_uuid": "stub-uuid", "version": {"number": "7.17.0", "build_flavor": "default"},
+                "tagline": "You Know, for Search",
+            }
+        if method == "GET" and parts[:3] == ["_cluster", "state", "metadata"]:
+            return self.cluster_state(parts[3] if len(parts) > 3 else "*")
+        if method == "GET" and len(parts) == 2 and parts[1] == "_mapping":
+            return self.get_mapping(parts[0])
+        if method == "GET" and len(parts) == 2 and parts[1] == "_alias":
+            return 200, {name: {"aliases": {}} for name in self.resolve(parts[0])}
+        if method == "POST" and len(parts) == 2 and parts[1] == "_pit":
+            return self.open_pit(parts[0])
+        if method == "DELETE" and parts == ["_pit"]:
+            return self.close_pit(body["id"])
+        if method == "POST" and parts == ["_search"] and body and "pit" in body:
+            return self.pit_search(body)
+        if method == "POST" and len(parts) == 2 and parts[1] == "_search" and "scroll" in params:
+            return self.start_scroll(parts[0], body or {}, int(params.get("size", 10)))
+        if method == "POST" and len(parts) == 2 and parts[1] == "_search":
+            return self.search(parts[0], body or {})
+        if method == "POST" and parts == ["_search", "scroll"]:
+            return self.next_scroll(body["scroll_id"])
+        if method == "DELETE" and parts == ["_search", "scroll"]:
+            return self.clear_scroll(body["scroll_id"])
+        return 404, error_body("unknown_endpoint", f"{method} {path}")
+
+    def get_mapping(self, expression):
+        if self.failing & set(expression.split(",")):
+            return 500, error_body("stub_failure", f"failed on {expression}")
+        return 200, {name: {"mappings": self.indices[name]["mappings"]} for name in self.resolve(expression)}
+
+    def cluster_state(self, expression):
+        # Only what mapping_fingerprints asks for through filter_path
+        indices = {}
+        for name in self.resolve(expression):
+            metadata = {"settings": {"index": {"uuid": f"uuid-{name}"}}}
+            if self.mapping_versions:
+                metadata["mapping_version"] = self.indices[name].get("mapping_version", 1)
+            indices[name] = metadata
+        return 200, {"metadata": {"indices": indices}}
+
+    def hits(self, expression, source):
+        # Every document of the indices as hits, in index then document order, with the
+        # _source filter applied
+        hits = []
+        for name in self.resolve(expression):
+            for doc in self.indices[name].get("docs", []):
+                hit = {"_index": name, "_id": doc["_id"], "_score": None}
+                if source is not False:
+                    hit["_source"] = {key: value for key, value in doc["_source"].items() if not source or key in source}
+                hits.append(hit)
+        return hits
+
+    def search(self, expression, body):
+        # The query isn't evaluated: every document matches
+        if "aggs" in body:
+            return self.aggregate(expression, body)
+        hits = self.hits(expression, body.get("_source"))
+        return 200, {"took": 1, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits[:body.get("size", 10)]}}
+
+    def aggregate(self, expression, body):
+        # The "keys" composite terms aggregation over _source values, paged with after/after_key,
+        # with an optional top_hits sub-aggregation. Only match_all, term and bool queries are
+        # evaluated; any other query matches every document.
+        if self.failing & set(expression.split(",")):
+            return 500, error_body("stub_failure", f"failed on {expression}")
+        composite = body["aggs"]["keys"]["composite"]
+        fields = [field for source in composite["sources"] for field in source]
+        buckets = {}
+        for name in self.resolve(expression):
+            for doc in self.indices[name].get("docs", []):
+                if all(field in doc["_source"] for field in fields) and matches(doc["_source"], body.get("query")):
+                    buckets.setdefault(tuple(doc["_source"][field] for field in fields), []).append(doc["_id"])
+        keys = sorted(buckets)
+        if "after" in composite:
+            after = tuple(composite["after"][field] for field in fields)
+            keys = [key for key in keys if key > after]
+        keys = keys[:composite["size"]]
+        top_hits = body["aggs"]["keys"].get("aggs", {}).get("ids", {}).get("top_hits")
+        page = []
+        for key in keys:
+            bucket = {"key": dict(zip(fields, key)), "doc_count": len(buckets[key])}
+            if top_hits:
+                bucket["ids"] = {"hits": {"hits": [{"_id": doc_id} for doc_id in buckets[key][:top_hits["size"]]]}}
+            if expression in self.malformed:
+                del bucket["doc_count"]
+            page.append(bucket)
+        result = {"buckets": page}
+        if page:
+            result["after_key"] = page[-1]["key"]
+        return 200, {"took": 1, "hits": {"hits": []}, "aggregations": {"keys": result}}
+
+    def page_failure(self):
+        if self.fail_after is not None and self.pages_served >= self.fail_after:
+            return 500, error_body("stub_failure", "search failed")
+        self.pages_served += 1
+        return None
+
+    def open_pit(self, expression):
+        if not self.pit:
+            return 405, error_body("method_not_allowed", "Incorrect HTTP method for uri [/_pit]")
+        with self.lock:
+            pit_id = f"pit-{len(self.pits) + len(self.closed_pits) + 1}"
+            # Filtered per search, since the _source filter comes with the search
+            self.pits[pit_id] = expression
+        return 200, {"id": pit_id}
+
+    def close_pit(self, pit_id):
+        with self.lock:
+            if self.pits.pop(pit_id, None) is None:
+                return 404, error_body("search_context_missing_exception", f"No search context found for id [{pit_id}]")
+            self.closed_pits.append(pit_id)
+        return 200, {"succeeded": True, "num_freed": 1}
+
+    def pit_search(self, body):
+        pit_id = body["pit"]["id"]
+        with self.lock:
+            expression = self.pits.get(pit_id)
+            if expression is None:
+                return 404, error_body("search_context_missing_exception", f"No search context found for id [{pit_id}]")
+            failure = self.page_failure()
+            if failure:
+                return failure
+            if self.rotate_pit:
+                del self.pits[pit_id]
+                pit_id = f"{pit_id.split('.')[0]}.{self.pages_served}"
+                self.pits[pit_id] = expression
+        assert body["sort"] == [{"_shard_doc": "asc"}], body["sort"]
+        hits = self.hits(expression, body.get("_source"))
+        start = body["search_after"][0] + 1 if "search_after" in body else 0
+        page = [dict(hit, sort=[position]) for position, hit in enumerate(hits[start:start + body["size"]], start)]
+        return 200, {"pit_id": pit_id, "hits": {"hits": page}}
+
+    def start_scroll(self, expression, body, size):
+        with self.lock:
+            scroll_id = f"scroll-{len(self.scrolls) + len(self.cleared_scrolls) + 1}"
+            self.scrolls[scroll_id] = [self.hits(expression, body.get("_source")), 0, size]
+        return self.next_scroll(scroll_id)
+
+    def next_scroll(self, scroll_id):
+        with self.lock:
+            if scroll_id not in self.scrolls:
+                return 404, error_body("search_context_missing_exception", f"No search context found for id [{scroll_id}]")
+            failure = self.page_failure()
+            if failure:
+                return failure
+            hits, position, size = self.scrolls[scroll_id]
+            self.scrolls[scroll_id][1] = position + size
+        return 200, {"_scroll_id": scroll_id, "hits": {"hits": hits[position:position + size]}}
+
+    def clear_scroll(self, scroll_ids):
+        with self.lock:
+            for scroll_id in scroll_ids:
+                if self.scrolls.pop(scroll_id, None) is not None:
+                    self.cleared_scrolls.append(scroll_id)
+        return 200, {"succeeded": True, "num_freed": len(scroll_ids)}
+
+
+def matches(source, query):
+    if not query or "match_all" in query:
+        return True
+    if "term" in query:
+        (field, value), = query["term"].items()
+        return source.get(field) == value
+    if "bool" in query:
+        clauses = query["bool"]
+        should = clauses.get("should", [])
+        return all(matches(source, clause) for clause in clauses.get("filter", [])) and (
+            sum(matches(source, clause) for clause in should) >= clauses.get("minimum_should_match", 1 if should else 0)
+        )
+    return True
+
+
+def error_body(kind, reason):
+    return {"error": {"root_cause": [{"type": kind, "reason": reason}], "type": kind, "reason": reason}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; with Nagle on, each keep-alive request waits ~40 ms
+    disable_nagle_algorithm = True
+
+    def respond(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        status, payload = self.server.cluster.handle(self.command, url.path, dict(parse_qsl(url.query)), body)
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        # The 7.14+ clients refuse to talk to a server without this header
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+def keyword_mapping(*fields):
+    return {"properties": {field: {"type": "keyword"} for field in fields}}
+
+
+class FetchMappingsTest(unittest.TestCase):
+    def setUp(self):
+        self.indices = {f"audit_{number:03d}": {"mappings": keyword_mapping(f"field_{number}")} for number in range(40)}
+
+    def test_one_request_when_names_fit(self):
+        with StubCluster(self.indices) as cluster:
+            mappings, errors = fetch_mappings(make_client(cluster.url), sorted(self.indices))
+        self.assertEqual(errors, {})
+        self.assertEqual(set(mappings), set(self.indices))
+        self.assertEqual(mappings["audit_007"]["mappings"], keyword_mapping("field_7"))
+        self.assertEqual(len(cluster.calls("GET", "/_mapping")), 1)
+
+    def test_long_name_lists_are_chunked(self):
+        names = sorted(self.indices)
+        original = Listfields.MAX_URL_CHARS
+        Listfields.MAX_URL_CHARS = 50
+        try:
+            with StubCluster(self.indices) as cluster:
+                mappings, errors = fetch_mappings(make_client(cluster.url), names, max_workers=4)
+        finally:
+            Listfields.MAX_URL_CHARS = original
+        self.assertEqual(errors, {})
+        self.assertEqual(set(mappings), set(self.indices))
+        requests = cluster.calls("GET", "/_mapping")
+        self.assertEqual(len(requests), len(Listfields.chunk_index_names(names, 50)))
+        requested = [name for request in requests for name in unquote(request[1]).strip("/").split("/")[0].split(",")]
+        self.assertEqual(sorted(requested), names)
+        for request in requests:
+            self.assertLessEqual(len(unquote(request[1]).split("/")[1]), 50)
+
+    def test_failed_chunk_is_retried_per_index(self):
+        with StubCluster(self.indices, failing=["audit_003"]) as cluster:
+            mappings, errors = fetch_mappings(make_client(cluster.url), sorted(self.indices))
+        self.assertEqual(set(mappings), set(self.indices) - {"audit_003"})
+        self.assertEqual(list(errors), ["audit_003"])
+        self.assertIn("stub_failure", errors["audit_003"])
+        # One request for everything, then one per index once it failed
+        self.assertEqual(len(cluster.calls("GET", "/_mapping")), 1 + len(self.indices))
+
+    def test_missing_indices_are_reported(self):
+        with StubCluster(self.indices) as cluster:
+            mappings, errors = fetch_mappings(make_client(cluster.url), ["audit_001", "no_such_index", "audit_00*", "nothing_*"])
+        self.assertEqual(set(mappings), {f"audit_{number:03d}" for number in range(10)})
+        # A concrete name that didn't come back is missing; a pattern matching nothing is not an error
+        self.assertEqual(errors, {"no_such_index": "index not found"})
+
+
+class FieldCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.indices = {
+            "audit_a": {"mappings": keyword_mapping("user", "action")},
+            "audit_b": {"mappings": {"properties": {"user": {"type": "keyword"}, "took": {"type": "long"}}}},
+            "audit_c": {"mappings": {"properties": {"address": {"properties": {"street": {"type": "text"}}}}}},
+        }
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fields.db")
+        self.cache = FieldCache(self.path)
+        self.addCleanup(self.cache.close)
+
+    def inventory(self, cluster, indices="audit_*"):
+        return cached_inventory(make_client(cluster.url), self.cache, indices)
+
+    def mapped(self, cluster):
+        # Index names of every _mapping request
+        return sorted(name for request in cluster.calls("GET", "/_mapping") for name in unquote(request[1]).strip("/").split("/")[0].split(","))
+
+    def test_only_changed_mappings_are_refetched(self):
+        with StubCluster(self.indices) as cluster:
+            inventory, errors, refetched = self.inventory(cluster)
+            self.assertEqual(errors, {})
+            self.assertEqual(refetched, ["audit_a", "audit_b", "audit_c"])
+            self.assertEqual(inventory["audit_c"], {"address.street": "text"})
+            self.assertEqual(self.cache.fingerprints("stub-uuid")["audit_a"], "uuid-audit_a:1")
+
+            # Nothing changed: fingerprints only, no mapping downloaded
+            cluster.requests.clear()
+            again, errors, refetched = self.inventory(cluster)
+            self.assertEqual((again, errors, refetched), (inventory, {}, []))
+            self.assertEqual(self.mapped(cluster), [])
+            self.assertEqual(len(cluster.calls("GET", "/_cluster/state/metadata/audit_*")), 1)
+
+            self.indices["audit_b"]["mappings"]["properties"]["host"] = {"type": "keyword"}
+            self.indices["audit_b"]["mapping_version"] = 2
+            cluster.requests.clear()
+            inventory, errors, refetched = self.inventory(cluster)
+            self.assertEqual(refetched, ["audit_b"])
+            self.assertEqual(self.mapped(cluster), ["audit_b"])
+            self.assertEqual(inventory["audit_b"], {"user": "keyword", "took": "long", "host": "keyword"})
+
+    def test_content_fingerprint_without_mapping_versions(self):
+        with StubCluster(self.indices, mapping_versions=False) as cluster:
+            self.assertEqual(self.inventory(cluster)[2], ["audit_a", "audit_b", "audit_c"])
+            # Every mapping is downloaded to compare, but only changed ones are stored again
+            self.indices["audit_a"]["mappings"]["properties"]["when"] = {"type": "date"}
+            cluster.requests.clear()
+            inventory, errors, refetched = self.inventory(cluster)
+            self.assertEqual(self.mapped(cluster), ["audit_*"])
+            self.assertEqual(refetched, ["audit_a"])
+            self.assertEqual(inventory["audit_a"], {"user": "keyword", "action": "keyword", "when": "date"})
+            self.assertEqual(len(self.cache.fingerprints("stub-uuid")["audit_a"]), 40)
+
+    def test_deleted_indices_are_dropped(self):
+        with StubCluster(self.indices) as cluster:
+            self.inventory(cluster, ["audit_a", "audit_b"])
+            del self.indices["audit_b"]
+            inventory, errors, refetched = self.inventory(cluster, ["audit_a", "audit_b"])
+            self.assertEqual(errors, {"audit_b": "index not found"})
+            self.assertEqual(list(inventory), ["audit_a"])
+            self.assertEqual(refetched, [])
+            self.assertEqual(list(self.cache.fingerprints("stub-uuid")), ["audit_a"])
+            self.assertEqual(self.cache.fields("stub-uuid", "audit_b"), {})
+
+    def test_find(self):
+        with StubCluster(self.indices) as cluster:
+            self.inventory(cluster)
+        self.assertEqual(self.cache.find("user"), [("stub-uuid", "audit_a", "user", "keyword"), ("stub-uuid", "audit_b", "user", "keyword")])
+        self.assertEqual(self.cache.find("*", "long"), [("stub-uuid", "audit_b", "took", "long")])
+        self.assertEqual(self.cache.find("address.*"), [("stub-uuid", "audit_c", "address.street", "text")])
+        self.assertEqual(self.cache.find("user", "text"), [])
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            status = main(["find", "--cache", self.path, "a*", "--type", "keyword"])
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout.getvalue().splitlines(), ["audit_a: action: keyword"])
+
+    def test_find_with_a_missing_cache(self):
+        missing = os.path.join(os.path.dirname(self.path), "fileds.db")
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            status = main(["find", "--cache", missing, "user"])
+        self.assertEqual(status, 2)
+        self.assertIn("can't read the cache", stderr.getvalue())
+        self.assertFalse(os.path.exists(missing))
+
+
+def documents(prefix, count):
+    return [{"_id": f"{prefix}-{number}", "_source": {"number": number, "message": f"{prefix} message {number}"}} for number in range(count)]
+
+
+class IterDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.indices = {
+            "logs_a": {"mappings": {}, "docs": documents("a", 1500)},
+            "logs_b": {"mappings": {}, "docs": documents("b", 845)},
+        }
+        self.expected = [f"a-{number}" for number in range(1500)] + [f"b-{number}" for number in range(845)]
+
+    def read(self, cluster, index="logs_*", **options):
+        return [hit["_id"] for hit in iter_documents(make_client(cluster.url), index, **options)]
+
+    def assert_released(self, cluster):
+        self.assertEqual(cluster.pits, {})
+        self.assertEqual(cluster.scrolls, {})
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name == "Listfields-prefetch"])
+
+    def test_point_in_time_reads_every_document(self):
+        for prefetch in (0, 1, 3):
+            with self.subTest(prefetch=prefetch), StubCluster(self.indices) as cluster:
+                self.assertEqual(self.read(cluster, page_size=1000, prefetch=prefetch), self.expected)
+                searches = cluster.calls("POST", "/_search")
+                self.assertEqual(len(searches), 3)
+                self.assertNotIn("search_after", searches[0][3])
+                self.assertEqual([search[3]["search_after"] for search in searches[1:]], [[999], [1999]])
+                self.assertEqual(cluster.closed_pits, ["pit-1"])
+                self.assertFalse(cluster.calls("POST", "/_search/scroll"))
+                self.assert_released(cluster)
+
+    def test_exact_multiple_of_page_size(self):
+        with StubCluster(self.indices) as cluster:
+            self.assertEqual(self.read(cluster, "logs_a", page_size=500), self.expected[:1500])
+            # The last full page can't tell there is nothing after it, so one empty page is read
+            self.assertEqual(len(cluster.calls("POST", "/_search")), 4)
+            self.assert_released(cluster)
+
+    def test_new_point_in_time_ids_are_followed(self):
+        with StubCluster(self.indices, rotate_pit=True) as cluster:
+            self.assertEqual(self.read(cluster, page_size=1000), self.expected)
+            pit_ids = [search[3]["pit"]["id"] for search in cluster.calls("POST", "/_search")]
+            self.assertEqual(pit_ids, ["pit-1", "pit-1.1", "pit-1.2"])
+            self.assertEqual(cluster.closed_pits, ["pit-1.3"])
+            self.assert_released(cluster)
+
+    def test_scroll_without_point_in_time(self):
+        for prefetch in (0, 2):
+            with self.subTest(prefetch=prefetch), StubCluster(self.indices, pit=False) as cluster:
+                self.assertEqual(self.read(cluster, page_size=1000, prefetch=prefetch), self.expected)
+                self.assertEqual(len(cluster.calls("POST", "/_pit")), 1)
+                self.assertEqual(cluster.calls("POST", "/logs_*/_search")[0][2]["size"], "1000")
+                self.assertEqual(cluster.cleared_scrolls, ["scroll-1"])
+                self.assert_released(cluster)
+
+    def test_source_filter(self):
+        with StubCluster(self.indices) as cluster:
+            hits = list(iter_documents(make_client(cluster.url), "logs_b", source=["number"], page_size=300))
+            self.assertEqual(len(hits), 845)
+            self.assertEqual(hits[7]["_source"], {"number": 7})
+            hits = list(iter_documents(make_client(cluster.url), "logs_b", source=False, page_size=300))
+            self.assertNotIn("_source", hits[0])
+
+    def test_closing_early_releases_the_search_context(self):
+        for pit, prefetch in ((True, 0), (True, 2), (False, 0), (False, 2)):
+            with self.subTest(pit=pit, prefetch=prefetch), StubCluster(self.indices, pit=pit) as cluster:
+                documents_read = iter_documents(make_client(cluster.url), "logs_*", page_size=100, prefetch=prefetch)
+                first = [next(documents_read)["_id"] for _ in range(150)]
+                documents_read.close()
+                self.assertEqual(first, self.expected[:150])
+                self.assertEqual(len(cluster.closed_pits if pit else cluster.cleared_scrolls), 1)
+                # Prefetching reads at most `prefetch` pages (and the one being handed over) ahead
+                if pit:
+                    pages = len(cluster.calls("POST", "/_search"))
+                else:
+                    pages = len(cluster.calls("POST", "/logs_*/_search")) + len(cluster.calls("POST", "/_search/scroll"))
+                self.assertLessEqual(pages, 2 + prefetch + 1)
+                self.assert_released(cluster)
+
+    def test_failed_page_raises_and_releases(self):
+        for pit, prefetch in ((True, 0), (True, 1), (False, 1)):
+            with self.subTest(pit=pit, prefetch=prefetch), StubCluster(self.indices, pit=pit, fail_after=2) as cluster:
+                read = []
+                with self.assertRaises(TransportError) as raised:
+                    for hit in iter_documents(make_client(cluster.url), "logs_*", page_size=100, prefetch=prefetch):
+                        read.append(hit["_id"])
+                self.assertEqual(raised.exception.status_code, 500)
+                self.assertEqual(read, self.expected[:200])
+                self.assert_released(cluster)
+
+
+class SearchCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.indices = {name: {"mappings": {}, "docs": documents(name, 3)} for name in ("idx1", "idx2", "idx3")}
+
+    def run_search(self, *arguments):
+        with StubCluster(self.indices) as cluster:
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+                status = main(["search", cluster.url, *arguments])
+        searched = sorted(request[1].strip("/").split("/")[0] for request in cluster.calls("POST", "/_search"))
+        queries = [request[3]["query"] for request in cluster.calls("POST", "/_search")]
+        hits = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        return status, searched, queries, hits
+
+    def test_text_then_indices(self):
+        status, searched, queries, hits = self.run_search("rvenkat", "idx1", "idx2")
+        self.assertEqual(status, 0)
+        self.assertEqual(searched, ["idx1", "idx2"])
+        self.assertEqual(queries[0]["multi_match"]["query"], "rvenkat")
+        self.assertEqual(len(hits), 6)
+
+    def test_query_makes_every_positional_an_index(self):
+        query = {"term": {"user": "rvenkat"}}
+        for arguments in (
+            ("idx1", "idx2", "--query", json.dumps(query)),
+            ("--query", json.dumps(query), "idx1", "idx2"),
+            ("idx1", "--query", json.dumps(query), "idx2", "--size", "2"),
+        ):
+            with self.subTest(arguments=arguments):
+                status, searched, queries, hits = self.run_search(*arguments)
+                self.assertEqual(status, 0)
+                self.assertEqual(searched, ["idx1", "idx2"])
+                self.assertEqual(queries, [query, query])
+
+    def test_unknown_option_is_still_an_error(self):
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            main(["search", "http://127.0.0.1:9", "text", "--no-such-option"])
+
+
+def messages(prefix, ids):
+    """Documents with the given message_id values, in order, each also carrying a sender."""
+    return [
+        {"_id": f"{prefix}-{number}", "_source": {"message_id": message_id, "sender": f"s{number % 2}"}}
+        for number, message_id in enumerate(ids)
+    ]
+
+
+class DuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        # In msgs_a, m00 and m03 occur twice and m05 three times; msgs_b holds m01 twice
+        ids = [f"m{number:02d}" for number in range(20)]
+        self.indices = {
+            "msgs_a": {"mappings": {}, "docs": messages("a", ids + ["m00", "m03", "m05", "m05"])},
+            "msgs_b": {"mappings": {}, "docs": messages("b", ["m01", "m02", "m01"])},
+            "msgs_c": {"mappings": {}, "docs": messages("c", ids)},
+        }
+
+    def test_keys_are_paged_with_after_key(self):
+        with StubCluster(self.indices) as cluster:
+            records = list(duplicate_keys(make_client(cluster.url), "msgs_a", "message_id", page_size=7))
+            self.assertEqual(records, [
+                {"index": "msgs_a", "key": "m00", "count": 2},
+                {"index": "msgs_a", "key": "m03", "count": 2},
+                {"index": "msgs_a", "key": "m05", "count": 3},
+            ])
+            # 20 keys in pages of 7: the third page is short, so nothing is asked after it
+            afters = [request[3]["aggs"]["keys"]["composite"].get("after") for request in cluster.calls("POST", "/msgs_a/_search")]
+            self.assertEqual(afters, [None, {"message_id": "m06"}, {"message_id": "m13"}])
+
+    def test_min_count(self):
+        with StubCluster(self.indices) as cluster:
+            records = list(duplicate_keys(make_client(cluster.url), "msgs_a", "message_id", min_count=3))
+        self.assertEqual(records, [{"index": "msgs_a", "key": "m05", "count": 3}])
+
+    def test_compound_key(self):
+        with StubCluster(self.indices) as cluster:
+            records = list(duplicate_keys(make_client(cluster.url), "msgs_a", ["message_id", "sender"], page_size=5))
+        # Two of the three m05 documents come from the same sender
+        self.assertEqual(records, [
+            {"index": "msgs_a", "key": {"message_id": "m00", "sender": "s0"}, "count": 2},
+            {"index": "msgs_a", "key": {"message_id": "m03", "sender": "s1"}, "count": 2},
+            {"index": "msgs_a", "key": {"message_id": "m05", "sender": "s1"}, "count": 2},
+        ])
+
+    def test_samples(self):
+        with StubCluster(self.indices) as cluster:
+            records = list(duplicate_keys(make_client(cluster.url), "msgs_a", "message_id", samples=2, page_size=10))
+            self.assertEqual({record["key"]: record["ids"] for record in records}, {
+                "m00": ["a-0", "a-20"],
+                "m03": ["a-3", "a-21"],
+                "m05": ["a-5", "a-22"],
+            })
+            # One sample request for the first page, which has all the duplicates, and none for the second
+            sample_requests = [request for request in cluster.calls("POST", "/msgs_a/_search") if "bool" in request[3]["query"]]
+            self.assertEqual(len(sample_requests), 1)
+
+    def test_indices_are_scanned_in_parallel(self):
+        with StubCluster(self.indices) as cluster:
+            stats = {}
+            records = list(find_duplicates(make_client(cluster.url), "msgs_*", "message_id", page_size=7, stats=stats))
+        self.assertEqual(sorted((record["index"], record["key"]) for record in records), [
+            ("msgs_a", "m00"), ("msgs_a", "m03"), ("msgs_a", "m05"), ("msgs_b", "m01"),
+        ])
+        self.assertEqual({index: summary["count"] for index, summary in stats.items()}, {"msgs_a": 3, "msgs_b": 1, "msgs_c": 0})
+        self.assertFalse(any("error" in summary for summary in stats.values()))
+
+    def test_failing_index_is_reported(self):
+        for options in ({"failing": ["msgs_b"]}, {"malformed": ["msgs_b"]}):
+            with self.subTest(**options), StubCluster(self.indices, **options) as cluster:
+                stats = {}
+                records = list(find_duplicates(make_client(cluster.url), "msgs_*", "message_id", stats=stats))
+                self.assertEqual(sorted(record["index"] for record in records), ["msgs_a"] * 3)
+                # A malformed response fails with a KeyError rather than a TransportError
+                self.assertIn("stub_failure" if "failing" in options else "KeyError", stats["msgs_b"]["error"])
+                self.assertEqual([index for index, summary in stats.items() if "error" in summary], ["msgs_b"])
+                stderr = io.StringIO()
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(stderr):
+                    status = main(["duplicates", cluster.url, "msgs_*", "--field", "message_id"])
+                self.assertEqual(status, 1)
+                self.assertIn("msgs_b: 0 duplicate keys", stderr.getvalue())
+
+    def test_closing_early_stops_the_workers(self):
+        indices = {f"msgs_{number:02d}": {"mappings": {}, "docs": messages(str(number), ["m1", "m1", "m2", "m2", "m3", "m3"])} for number in range(12)}
+        with StubCluster(indices, delay=0.05) as cluster:
+            records = find_duplicates(make_client(cluster.url), "msgs_*", "message_id", page_size=1, max_workers=2)
+            first = next(records)
+            records.close()
+            self.assertEqual(first["count"], 2)
+            # Only the indices being scanned when the stream was closed were read from; the
+            # workers stop at their next record, and indices waiting for a worker are skipped
+            scanned = {request[1].strip("/").split("/")[0] for request in cluster.calls("POST", "/_search")}
+            self.assertLessEqual(len(scanned), 2)
+            self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith("ThreadPoolExecutor")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,27 @@
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import lzma
+import math
+import mmap
+import os
+import pathlib
+import queue
+import re
 import sqlite3
+import sys
+import threading
+import time
 import tkinter as tk
+import zlib
 from tkinter import ttk, messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from json.encoder import encode_basestring_ascii
 
 class ThemeManager:
     def __init__(self):
@@ -13,6 +33,7 @@ class ThemeManager:
                 "entry_fg": "white",
                 "button_bg": "#4CAF50",
                 "button_fg": "white",
+                "button_active_bg": "#45a049",
                 "tree_bg": "#3d3d3d",
                 "tree_fg": "white",
                 "tree_heading_bg": "#4d4d4d",
@@ -25,6 +46,7 @@ class ThemeManager:
                 "entry_fg": "black",
                 "button_bg": "#4CAF50",
                 "button_fg": "white",
+                "button_active_bg": "#45a049",
                 "tree_bg": "white",
                 "tree_fg": "black",
                 "tree_heading_bg": "#e0e0e0",
@@ -42,64 +64,1999 @@ class ThemeManager:
         else:
             raise ValueError(f"Theme '{theme_name}' not found.")
 
+    def style_name(self, theme_name=None):
+        return f"notes-{(theme_name or self.current_theme).lower()}"
+
+    def style_settings(self, theme_name=None):
+        # ttk.Style.theme_create settings for one of our themes, on top of the "clam" theme
+        theme = self.themes[theme_name or self.current_theme]
+        return {
+            ".": {"configure": {"background": theme["bg"], "foreground": theme["fg"], "font": ("Arial", 10)}},
+            "TFrame": {"configure": {"background": theme["bg"]}},
+            "TLabel": {"configure": {"background": theme["bg"], "foreground": theme["fg"]}},
+            "Header.TLabel": {"configure": {"background": theme["button_bg"], "foreground": theme["button_fg"], "font": ("Arial", 16, "bold"), "padding": (10, 5)}},
+            "Small.TLabel": {"configure": {"font": ("Arial", 9)}},
+            "TEntry": {"configure": {"fieldbackground": theme["entry_bg"], "foreground": theme["entry_fg"], "insertcolor": theme["entry_fg"]}},
+            "TCombobox": {
+                "configure": {"fieldbackground": theme["entry_bg"], "foreground": theme["entry_fg"], "background": theme["bg"], "arrowcolor": theme["fg"]},
+                "map": {"fieldbackground": [("readonly", theme["entry_bg"])], "foreground": [("readonly", theme["entry_fg"])]},
+            },
+            "TButton": {
+                "configure": {"background": theme["button_bg"], "foreground": theme["button_fg"], "padding": (8, 4)},
+                "map": {"background": [("disabled", theme["tree_heading_bg"]), ("active", theme["button_active_bg"])]},
+            },
+            "Treeview": {
+                "configure": {"background": theme["tree_bg"], "foreground": theme["tree_fg"], "fieldbackground": theme["tree_bg"]},
+                "map": {"background": [("selected", theme["button_bg"])], "foreground": [("selected", theme["button_fg"])]},
+            },
+            "Treeview.Heading": {"configure": {"background": theme["tree_heading_bg"], "foreground": theme["tree_heading_fg"]}},
+            "TScrollbar": {"configure": {"background": theme["tree_heading_bg"], "troughcolor": theme["bg"], "arrowcolor": theme["fg"]}},
+        }
+
+def split_note(note):
+    # First line is the note name, the rest its content; single-line notes are "Untitled"
+    if '\n' in note:
+        name, content = note.split('\n', 1)
+    else:
+        name, content = "Untitled", note
+    return name.strip(), content.strip()
+
+def iter_note_file(path, separator=b"==="):
+    # Streams (name, content, end_offset) for each ===-delimited note in a file without reading it
+    # into memory: the file is memory-mapped and only the current record is ever copied out of it.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find(separator, start)
+                if end == -1:
+                    end = size
+                note = mm[start:end].decode("utf-8", errors="replace").strip()
+                if note:
+                    name, content = split_note(note)
+                    yield name, content, end
+                start = end + len(separator)
+
+# Columns of a JSONL or CSV export; imports need content and use name and last_seen if present
+EXPORT_FORMATS = ("jsonl", "csv")
+EXPORT_FIELDS = ("id", "name", "content", "use_count", "last_seen")
+
+def export_line(note_id, name, content, use_count, last_seen):
+    # One JSONL record with the EXPORT_FIELDS keys, built directly from the C string encoder:
+    # about three times faster than json.dumps of a dict, which dominated export time
+    return (
+        f'{{"id": {note_id}, "name": {encode_basestring_ascii(name)}, "content": {encode_basestring_ascii(content)}, '
+        f'"use_count": {use_count}, "last_seen": {"null" if last_seen is None else repr(float(last_seen))}}}\n'
+    )
+
+def export_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def iter_export_file(path, format="jsonl", offset=0):
+    # Streams (fields, end_offset) for each note in a JSONL or CSV export, starting at a byte offset
+    # where an earlier record ended. Offsets count the bytes read, so they stay exact for CSV
+    # records whose quoted content spans several lines. A CSV header is always read from the start.
+    with open(path, "rb") as f:
+        position = 0
+        if format == "jsonl":
+            f.seek(offset)
+            position = offset
+            for line in f:
+                position += len(line)
+                if line.strip():
+                    try:
+                        yield json.loads(line), position
+                    except ValueError as e:
+                        raise ValueError(f"{path}: bad JSON line ending at byte {position}: {e}") from None
+            return
+
+        def lines():
+            nonlocal position
+            for line in f:
+                position += len(line)
+                yield line.decode("utf-8")
+
+        # Notes are often far larger than csv's default 128 KB field limit. The limit is global to
+        # the csv module and has to fit a C long, which is 32 bits on Windows.
+        csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+        reader = csv.reader(lines())
+        header = next(reader, None)
+        if header is None:
+            return
+        if offset > position:
+            f.seek(offset)
+            position = offset
+        for row in reader:
+            if row:
+                yield dict(zip(header, row)), position
+
+# Per-row codec marker in notes.codec; 0 means content is stored as plain TEXT
+CODECS = {"zlib": 1, "lzma": 2}
+
+def encode_body(content, compression="zlib", threshold=4096):
+    # (codec, stored content) for a note body: bodies of at least `threshold` bytes are compressed,
+    # unless compression doesn't save at least a tenth of the size
+    if not compression:
+        return 0, content
+    raw = content.encode("utf-8")
+    if len(raw) < threshold:
+        return 0, content
+    packed = zlib.compress(raw, 6) if compression == "zlib" else lzma.compress(raw, preset=6)
+    if len(packed) > 0.9 * len(raw):
+        return 0, content
+    return CODECS[compression], packed
+
+def decode_body(codec, content):
+    # Compressed bodies are BLOBs. A TEXT body is plain whatever its codec says, as when another
+    # program edited a compressed note without resetting codec.
+    if isinstance(content, str):
+        return content
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(content).decode("utf-8")
+    if codec == CODECS["lzma"]:
+        return lzma.decompress(content).decode("utf-8")
+    return content
+
+def content_hash(content):
+    # Fingerprint of a note body for duplicate detection, taken over the plain text so it doesn't
+    # depend on how the body is stored
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+def estimate_size(value):
+    # Rough in-memory footprint of a query result: rows are lists/tuples of str/int/None
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def note_row_values(note):
+    # Treeview values for a listing row (id, name, preview, length); search results carry a
+    # snippet around the match in place of the preview
+    note_id, name, preview, length = note
+    return note_id, name, preview, f"{length:,}", "📋"
+
+class TreeRows:
+    # Keeps a Treeview showing a list of notes by diffing against what it already shows, keyed by
+    # note id (the item iid): only rows that appeared, disappeared, moved or changed are touched,
+    # so selection, focus and scroll position survive a refresh and its cost follows the change.
+    # The tree is only ever filled through here, so what it shows is tracked in Python instead of
+    # being read back from Tk.
+    def __init__(self, tree):
+        self.tree = tree
+        self.shown = {}
+        self.order = []
+
+    def update(self, notes):
+        rows = {note[0]: note for note in notes}
+        current = self.order
+        gone = [note_id for note_id in current if note_id not in rows]
+        if gone:
+            self.tree.delete(*map(str, gone))
+            for note_id in gone:
+                del self.shown[note_id]
+            current = [note_id for note_id in current if note_id in rows]
+        # Walk the new order against the current one: rows already in place are only compared,
+        # new rows are inserted and rows found out of order are moved to their new position
+        position = 0
+        moved = set()
+        for index, (note_id, note) in enumerate(rows.items()):
+            while position < len(current) and current[position] in moved:
+                position += 1
+            if position < len(current) and current[position] == note_id:
+                position += 1
+            elif note_id in self.shown:
+                self.tree.move(str(note_id), "", index)
+                moved.add(note_id)
+            else:
+                self.tree.insert("", index, iid=str(note_id), values=note_row_values(note))
+                self.shown[note_id] = note
+                continue
+            if self.shown[note_id] != note:
+                self.tree.item(str(note_id), values=note_row_values(note))
+                self.shown[note_id] = note
+        self.order = list(rows)
+
+class ResultCache:
+    # LRU of query results bounded by estimated bytes and by entry count. Each entry remembers
+    # the NoteManager generation it was read at and is discarded when the generation moves on.
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self.lock:
+            return self.lookup(key, generation)
+
+    def lookup(self, key, generation):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        entry_generation, size, value = entry
+        if entry_generation != generation:
+            self.remove(key)
+            self.invalidations += 1
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def put(self, key, generation, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.store(key, generation, size, value)
+
+    def store(self, key, generation, size, value):
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (generation, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            }
+
+class Instrumentation:
+    # Opt-in timings for NoteManager: calls, latency histogram and rows returned per method, and
+    # per-statement timings from the connections' trace callbacks. The trace callback only reports
+    # when a statement starts, so a statement is timed until the next one starts on the same thread
+    # or the outermost instrumented call returns, which includes fetching its rows. Statements that
+    # take at least slow_query_ms are kept with their EXPLAIN QUERY PLAN.
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+    # Literals in traced SQL (blobs, strings, numbers) and the IN lists they leave behind, so
+    # statements are grouped by shape rather than by the values bound to them
+    SQL_LITERALS = re.compile(r"\b[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+    SQL_LISTS = re.compile(r"\(\?(?:, \?)+\)")
+
+    def __init__(self, slow_query_ms=100, recent=1000, max_slow=50):
+        self.slow_query_ms = slow_query_ms
+        self.recent = recent
+        self.methods = {}
+        self.statements = {}
+        self.slow_queries = deque(maxlen=max_slow)
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def trace(self, sql):
+        # set_trace_callback target. Statements run inside triggers are reported as "-- ..." and
+        # count towards the statement that fired them; SQLite reports the firing statement again
+        # after them, which continues it rather than starting a new one.
+        if not getattr(self.local, "depth", 0) or sql.startswith("--"):
+            return
+        if self.local.pending is not None and self.local.pending[0] == sql:
+            return
+        now = time.perf_counter()
+        self.finish_statement(now)
+        self.local.pending = (sql, now)
+
+    def finish_statement(self, now):
+        pending = self.local.pending
+        if pending is None:
+            return
+        self.local.pending = None
+        sql, started = pending
+        elapsed_ms = 1000 * (now - started)
+        shape = self.SQL_LISTS.sub("(?, ...)", self.SQL_LITERALS.sub("?", sql))
+        with self.lock:
+            stats = self.statements.setdefault(shape, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms >= self.slow_query_ms:
+            self.local.slow.append((sql, elapsed_ms))
+
+    def begin(self):
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0:
+            self.local.pending = None
+            self.local.slow = []
+        self.local.depth = depth + 1
+
+    def end(self, name, elapsed, result, error):
+        # Record a finished call; returns the slow statements of the outermost call, if this was it
+        self.local.depth -= 1
+        slow = []
+        if self.local.depth == 0:
+            self.finish_statement(time.perf_counter())
+            slow = self.local.slow
+        elapsed_ms = 1000 * elapsed
+        rows = len(result) if isinstance(result, list) else int(isinstance(result, tuple))
+        bucket = next((f"<={limit}" for limit in self.BUCKETS_MS if elapsed_ms <= limit), f">{self.BUCKETS_MS[-1]}")
+        with self.lock:
+            stats = self.methods.get(name)
+            if stats is None:
+                stats = self.methods[name] = {
+                    "calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "histogram": {}, "recent": deque(maxlen=self.recent),
+                }
+            stats["calls"] += 1
+            stats["errors"] += error
+            stats["rows"] += rows
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["histogram"][bucket] = stats["histogram"].get(bucket, 0) + 1
+            stats["recent"].append(elapsed_ms)
+        return slow
+
+    def record_slow(self, name, sql, elapsed_ms, plan):
+        with self.lock:
+            self.slow_queries.append({
+                "method": name,
+                "ms": round(elapsed_ms, 3),
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "sql": sql if len(sql) <= 2000 else sql[:2000] + "...",
+                "plan": plan,
+            })
+
+    def snapshot(self):
+        labels = [f"<={limit}" for limit in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}"]
+        with self.lock:
+            methods = {}
+            for name, stats in self.methods.items():
+                ordered = sorted(stats["recent"])
+                methods[name] = {
+                    **{key: value for key, value in stats.items() if key not in ("recent", "histogram")},
+                    "total_ms": round(stats["total_ms"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "p50_ms": round(ordered[int(0.50 * (len(ordered) - 1))], 3),
+                    "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+                    "histogram": {label: stats["histogram"].get(label, 0) for label in labels},
+                }
+            statements = {
+                sql: {"count": stats["count"], "total_ms": round(stats["total_ms"], 3), "max_ms": round(stats["max_ms"], 3)}
+                for sql, stats in sorted(self.statements.items(), key=lambda item: -item[1]["total_ms"])
+            }
+            return {
+                "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "slow_query_ms": self.slow_query_ms,
+                "methods": methods,
+                "statements": statements,
+                "slow_queries": list(self.slow_queries),
+            }
+
+    def dump(self, path, extra=None):
+        with open(path, "w", encoding="utf-8") as stats_file:
+            json.dump({**self.snapshot(), **(extra or {})}, stats_file, indent=2)
+
+class HotCopy:
+    # In-memory copy of a notes database that a NoteManager serves reads from (hot=True).
+    # It is filled with the backup API, LOAD_PAGES pages per step, on a background thread, so
+    # opening a large database returns at once and reads go to disk until the copy is ready.
+    # Writes still commit on disk, which stays the only durable copy: a crash loses nothing and
+    # the next start simply loads a new copy. Before a read that follows a commit (by this
+    # manager or any other process), the copy catches up on the notes listed in the disk
+    # database's notes_changes log since it was loaded. A copy further behind than the log
+    # reaches, with more than RELOAD_CHANGES notes to catch up on, or that failed to apply them,
+    # is dropped and loaded again. The copy is one connection, so reads from it take turns.
+    LOAD_PAGES = 1024
+    RELOAD_CHANGES = 1000
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+        self.stopped = threading.Event()
+        self.conn = None
+        self.error = None
+        self.applied = 0
+        self.synced = None
+        self.stats = {"load_seconds": None, "pages": 0, "catch_ups": 0, "notes_applied": 0}
+        self.loader = threading.Thread(target=self.load, name="HotCopy-load", daemon=True)
+        self.loader.start()
+
+    def load(self):
+        started = time.perf_counter()
+        try:
+            conn = self.manager.connect("file:notes-hot?mode=memory", uri=True, check_same_thread=False)
+            source = self.manager.connect(self.manager.db_name, check_same_thread=False)
+            try:
+                source.backup(conn, pages=self.LOAD_PAGES, progress=self.progress, sleep=0)
+            finally:
+                source.close()
+            # The copy's own changes aren't logged; it reads the disk database's log instead
+            for event in ("insert", "update", "delete"):
+                conn.execute(f"DROP TRIGGER IF EXISTS notes_changes_{event}")
+            # Compressed notes queued on disk but not yet indexed there
+            with conn:
+                self.manager.index_queued(conn)
+            conn.execute("ATTACH ? AS disk", (pathlib.Path(self.manager.db_name).resolve().as_uri() + "?mode=ro",))
+            row = conn.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'notes_changes'").fetchone()
+            self.applied = row[0] if row else 0
+            self.conn = conn
+            self.stats["load_seconds"] = round(time.perf_counter() - started, 3)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.loaded.set()
+
+    def progress(self, status, remaining, total):
+        self.stats["pages"] = total - remaining
+        if self.stopped.is_set():
+            raise RuntimeError("hot copy closed while loading")
+
+    def ready(self):
+        return self.conn is not None
+
+    def acquire(self, generation):
+        # The copy's connection, caught up with `generation` (see NoteManager.generation), with
+        # the copy locked for the caller; None if it has to be reloaded
+        self.lock.acquire()
+        try:
+            if self.stopped.is_set():
+                raise sqlite3.OperationalError("hot copy closed")
+            if generation != self.synced:
+                if not self.catch_up():
+                    raise sqlite3.OperationalError("hot copy fell behind")
+                self.synced = generation
+            return self.conn
+        except sqlite3.Error as e:
+            self.error = str(e)
+            self.lock.release()
+            return None
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def release(self):
+        self.lock.release()
+
+    def catch_up(self):
+        # Re-copies every note written on disk since the last catch-up, in one transaction on the
+        # copy that reads one snapshot of the disk database. The copy's triggers and index queue
+        # keep its text indexes in step. False if the log no longer reaches back far enough or the copy is
+        # too far behind to be worth catching up.
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            triggers = conn.execute(
+                "SELECT count(*) FROM disk.sqlite_master WHERE type = 'trigger' AND name IN ('notes_changes_insert', 'notes_changes_update', 'notes_changes_delete')"
+            ).fetchone()[0]
+            if triggers < 3:
+                # The log was dropped, so writes since aren't in it
+                conn.rollback()
+                return False
+            row = conn.execute("SELECT seq FROM disk.sqlite_sequence WHERE name = 'notes_changes'").fetchone()
+            latest = row[0] if row else 0
+            if latest == self.applied:
+                conn.rollback()
+                return True
+            oldest = conn.execute("SELECT min(seq) FROM disk.notes_changes").fetchone()[0]
+            if oldest is None or oldest > self.applied + 1:
+                conn.rollback()
+                return False
+            ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT note_id FROM disk.notes_changes WHERE seq > ? AND seq <= ?", (self.applied, latest)
+            )]
+            # Note id 0 marks where the log was dropped and writes went unlogged
+            if len(ids) > self.RELOAD_CHANGES or 0 in ids:
+                conn.rollback()
+                return False
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                marks = ", ".join("?" * len(chunk))
+                conn.execute(f"DELETE FROM main.notes WHERE id IN ({marks})", chunk)
+                conn.execute(f"INSERT INTO main.notes SELECT * FROM disk.notes WHERE id IN ({marks})", chunk)
+            self.manager.index_queued(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self.applied = latest
+        self.stats["catch_ups"] += 1
+        self.stats["notes_applied"] += len(ids)
+        return True
+
+    def snapshot(self):
+        return {**self.stats, "ready": self.ready(), "error": self.error, "applied_seq": self.applied}
+
+    def close(self):
+        self.stopped.set()
+        self.loader.join()
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+def instrumented(method):
+    # Time a NoteManager method when instrumentation is on; outermost, so cache hits count too
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return method(self, *args, **kwargs)
+        instrumentation.begin()
+        started = time.perf_counter()
+        result = None
+        error = True
+        try:
+            result = method(self, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            slow = instrumentation.end(method.__name__, time.perf_counter() - started, result, error)
+            for sql, elapsed_ms in slow:
+                instrumentation.record_slow(method.__name__, sql, elapsed_ms, self.explain_query_plan(sql))
+    return wrapper
+
+def cached_query(method):
+    # Serve a read-only NoteManager method from its result cache, keyed by method name and arguments
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        # Read the generation before querying, so a write landing mid-query leaves the entry stale
+        generation = self.generation()
+        found, value = self.cache.get(key, generation)
+        if found:
+            return value
+        value = method(self, *args, **kwargs)
+        self.cache.put(key, generation, value)
+        return value
+    return wrapper
+
+def bumps_generation(method):
+    # Mark a NoteManager method as a write: every cached result read before it becomes stale
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.write_generation += 1
+    return wrapper
+
+def write_transaction(retry=True):
+    # Serialize a NoteManager write on the writer connection. With retry, a write that finds the
+    # database locked by another process (past the busy timeout) is retried with backoff.
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            attempts = self.lock_retries if retry else 0
+            delay = 0.05
+            while True:
+                try:
+                    with self.write_lock:
+                        return method(self, *args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if attempts <= 0 or str(e) not in ("database is locked", "database is busy"):
+                        raise
+                attempts -= 1
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        wrapper.writes = True
+        return wrapper
+    return decorate
+
 class NoteManager:
-    def __init__(self, db_name="notes.db"):
-        self.conn = sqlite3.connect(db_name)
+    # Characters and operators that mark a search box entry as an FTS5 expression rather than plain
+    # terms: phrases, prefixes, groups, operators, column filters (name:, {name content}:) and ^ for
+    # a phrase at the start of a column. Any other colon, as in 10:30 or a URL, is a plain term.
+    FTS_SYNTAX = re.compile(r'["*()]|\b(?:AND|OR|NOT|NEAR)\b|\b(?:name|content)\s*:|\{[\w\s]*\}\s*:|(?<![^\s(:])\^')
+    # Listings return (id, name, preview, length); full content is fetched by id with get_note.
+    # preview and length are stored ahead of content in each row, so a listing only reads the start
+    # of the record and never touches the overflow pages holding a large note body. Triggers
+    # fill them in for plain TEXT bodies that other programs write (see create_preview_triggers).
+    PREVIEW_CHARS = 200
+    # Large bodies are stored compressed (see encode_body), with the codec in a per-row marker.
+    # Other programs reading notes.db (note5.py, noteApp2.py, the sqlite3 shell) get those bodies
+    # as zlib or lzma BLOBs; the notes_text view decodes them but needs note_body registered
+    # (see connect), and `note6.py export` writes every note as plain text. Other programs may
+    # write plain TEXT bodies: triggers keep the text indexes and content_hash in step.
+    # content_hash is unique, so an exact duplicate body is found with one index lookup. It is NULL
+    # for duplicates kept with the "allow" policy, for notes from before hashing (see dedupe) and,
+    # until rehash_changed runs, for notes whose body another program changed.
+    NOTES_COLUMNS = (
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, preview TEXT NOT NULL DEFAULT '', length INTEGER NOT NULL DEFAULT 0, "
+        "codec INTEGER NOT NULL DEFAULT 0, content_hash BLOB, use_count INTEGER NOT NULL DEFAULT 1, last_seen REAL, content NOT NULL)"
+    )
+    HASH_COLUMNS = (("content_hash", "BLOB"), ("use_count", "INTEGER NOT NULL DEFAULT 1"), ("last_seen", "REAL"))
+    LISTING_COLUMNS = "notes.id, notes.name, notes.preview, notes.length"
+    INSERT_NOTE = "INSERT INTO notes (name, preview, length, codec, content_hash, last_seen, content, use_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    # Searches return the SEARCH_LIMIT best notes by BM25, a match in the name weighing NAME_WEIGHT
+    # times one in the body, with a snippet of the body around the match in place of the preview.
+    # SNIPPET_MARKERS bracket the matched text. Snippets are SNIPPET_WORDS tokens of the word index
+    # or SNIPPET_CHARS of the trigram index, whose tokens are characters.
+    SEARCH_LIMIT = 200
+    NAME_WEIGHT = 10.0
+    SNIPPET_MARKERS = ("«", "»")
+    SNIPPET_WORDS = 16
+    SNIPPET_CHARS = 64
+    # Fuzzy search ranks notes by the share of the query's trigrams they hold, keeping at most
+    # FUZZY_LIMIT notes holding at least FUZZY_THRESHOLD of them. Each trigram may match an equal
+    # share of FUZZY_POSTINGS notes; commoner ones say little about which note is meant, the way
+    # a search engine drops stop words, and leaving them out bounds the cost of a search.
+    FUZZY_THRESHOLD = 0.5
+    FUZZY_LIMIT = 200
+    FUZZY_POSTINGS = 50000
+    # Batches of at least this many new notes are indexed in bulk (see bulk_indexing)
+    BULK_INDEX_ROWS = 100
+    # Entries kept in the notes_changes log that hot copies catch up from (see HotCopy)
+    CHANGE_LOG_ROWS = 100000
+    # What happens when a note's body is already stored: "skip" drops it, "bump" adds the new
+    # note's use_count (1, or the count in an import) to the existing note's and keeps the later
+    # last_seen, "allow" stores it again
+    DUPLICATE_POLICIES = ("skip", "bump", "allow")
+
+    def __init__(self, db_name="notes.db", cache_bytes=0, cache_entries=1024, concurrent=False, readers=4, busy_timeout=5.0, lock_retries=5,
+                 compression="zlib", compress_threshold=4096, duplicates="bump", instrument=False, slow_query_ms=100, hot=False):
+        # hot=True serves reads from an in-memory copy of the database, loaded in the background
+        # and kept current from the notes_changes log (see HotCopy); it needs RAM for the whole file.
+        # duplicates is the default policy for exact duplicate bodies (see DUPLICATE_POLICIES).
+        # instrument=True records per-method and per-statement timings (see Instrumentation).
+        # compression ("zlib", "lzma" or None) applies to bodies of at least compress_threshold bytes.
+        # cache_bytes > 0 turns on the result cache for listings and searches.
+        # concurrent=True makes the manager shareable across threads: the database runs in WAL mode,
+        # writes are serialized on one writer connection, and reads use a pool of up to `readers`
+        # read-only connections, one checked out per thread for the duration of a call.
+        self.db_name = db_name
+        self.instrumentation = Instrumentation(slow_query_ms) if instrument else None
+        self.explain_conn = None
+        self.explain_lock = threading.Lock()
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        if duplicates not in self.DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {duplicates}")
+        self.duplicates = duplicates
+        self.concurrent = concurrent and db_name not in (":memory:", "")
+        self.busy_timeout = busy_timeout
+        self.lock_retries = lock_retries
+        self.write_lock = threading.RLock()
+        self.conn = self.connect(db_name, check_same_thread=not self.concurrent)
+        if self.concurrent:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            # WAL is crash-safe with NORMAL; only the last transactions can be lost on power failure
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        # PRAGMA data_version for the result cache is read on a connection of its own, so checking
+        # it never waits on the writer
+        self.version_conn = self.connect(db_name, check_same_thread=False) if self.concurrent else self.conn
+        self.version_lock = threading.Lock()
+        self.reader_slots = threading.BoundedSemaphore(readers)
+        self.idle_readers = queue.LifoQueue()
+        self.checked_out = {}
         self.create_table()
+        self.fts_enabled = self.create_fts_index()
+        self.trigram_enabled = False
+        self.trigram_enabled = self.create_trigram_index()
+        # Compressed notes and bodies other programs changed since this database was last open here
+        with self.conn:
+            self.index_queued()
+            self.rehash_changed()
+        self.write_generation = 0
+        self.cache = ResultCache(cache_bytes, cache_entries) if cache_bytes else None
+        self.hot = None
+        self.hot_lock = threading.Lock()
+        if hot and db_name not in (":memory:", ""):
+            self.create_change_log()
+            self.hot = HotCopy(self)
+
+    def connect(self, target, **kwargs):
+        conn = sqlite3.connect(target, timeout=self.busy_timeout, **kwargs)
+        # Used by the notes_text view and searches to read compressed bodies as plain text. Other
+        # programs can write to notes.db without it (see create_index_triggers), but reading the
+        # view needs it registered (see decode_body); `note6.py export` writes plain text.
+        conn.create_function("note_body", 2, decode_body, deterministic=True)
+        if self.concurrent:
+            conn.execute("PRAGMA cache_size = -65536")  # 64 MB page cache per connection
+            conn.execute("PRAGMA mmap_size = 268435456")  # read pages through a 256 MB memory map
+            conn.execute("PRAGMA temp_store = MEMORY")
+        if self.instrumentation:
+            conn.set_trace_callback(self.instrumentation.trace)
+        return conn
+
+    def open_reader(self):
+        uri = pathlib.Path(self.db_name).resolve().as_uri() + "?mode=ro"
+        return self.connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def reading(self):
+        # Connection for a read on the calling thread. Nested reads on the same thread share it.
+        thread_id = threading.get_ident()
+        conn = self.checked_out.get(thread_id)
+        if conn is not None:
+            yield conn
+            return
+        hot = self.hot_copy()
+        if hot is not None:
+            conn = hot.conn
+            self.checked_out[thread_id] = conn
+            try:
+                yield conn
+            finally:
+                del self.checked_out[thread_id]
+                hot.release()
+            return
+        if not self.concurrent:
+            conn = self.conn
+        else:
+            self.reader_slots.acquire()
+            try:
+                conn = self.idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self.open_reader()
+        self.checked_out[thread_id] = conn
+        try:
+            yield conn
+        finally:
+            del self.checked_out[thread_id]
+            if self.concurrent:
+                self.idle_readers.put(conn)
+                self.reader_slots.release()
+
+    def hot_copy(self):
+        # The hot copy, caught up and locked for a read, or None to read from disk. A copy that
+        # can't catch up is replaced by a new one loading in the background.
+        hot = self.hot
+        if hot is None or not hot.ready():
+            return None
+        if hot.acquire(self.generation()) is not None:
+            return hot
+        with self.hot_lock:
+            if self.hot is hot:
+                # The log may have been dropped (see drop_change_log) while the copy was in use
+                self.create_change_log()
+                self.hot = HotCopy(self)
+        hot.close()
+        return None
+
+    def wait_until_hot(self, timeout=None):
+        # Blocks until reads are served from a caught-up hot copy; False if that didn't happen in time
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.hot is not None:
+            hot = self.hot
+            if not hot.loaded.wait(None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+            if hot.error and hot is self.hot:
+                return False
+            with self.reading() as conn:
+                if conn is hot.conn:
+                    return True
+        return False
+
+    def create_change_log(self):
+        # Ids of the notes each write touched, in commit order, for hot copies to catch up from.
+        # Every trigger trims the log to its last CHANGE_LOG_ROWS entries; a copy further behind
+        # than that reloads. Once created, every writer to the database keeps the log, at the cost
+        # of an insert and a trimming delete per note written, until drop_change_log removes it.
+        with self.write_lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS notes_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, note_id INTEGER NOT NULL)")
+            for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+                self.conn.execute(
+                    f"""CREATE TRIGGER IF NOT EXISTS notes_changes_{event.lower()} AFTER {event} ON notes BEGIN
+                        INSERT INTO notes_changes (note_id) VALUES ({row}.id);
+                        DELETE FROM notes_changes WHERE seq <= last_insert_rowid() - {self.CHANGE_LOG_ROWS};
+                    END"""
+                )
+
+    def drop_change_log(self):
+        # Stops logging changes once no hot copy is in use (the drop-change-log command). The
+        # emptied table stays so its sequence carries on, and a marker entry with note id 0 tells
+        # any copy still running that the log has a gap; it reloads and logs changes again.
+        with self.write_lock, self.conn:
+            self.conn.execute("BEGIN")
+            dropped = False
+            for event in ("insert", "update", "delete"):
+                dropped |= self.conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"notes_changes_{event}",)
+                ).fetchone() is not None
+                self.conn.execute(f"DROP TRIGGER IF EXISTS notes_changes_{event}")
+            if dropped:
+                self.conn.execute("DELETE FROM notes_changes")
+                self.conn.execute("INSERT INTO notes_changes (note_id) VALUES (0)")
+        return dropped
+
+    def close(self):
+        if self.hot is not None:
+            self.hot.close()
+        while not self.idle_readers.empty():
+            self.idle_readers.get_nowait().close()
+        if self.explain_conn is not None and self.explain_conn is not self.conn:
+            self.explain_conn.close()
+        if self.version_conn is not self.conn:
+            self.version_conn.close()
+        self.conn.close()
+
+    def generation(self):
+        # Bumped by our own writes; PRAGMA data_version changes when another connection commits
+        with self.version_lock:
+            return self.write_generation, self.version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
+
+    def diagnostics(self):
+        # Instrumentation snapshot plus cache stats; safe to call from any thread
+        if self.instrumentation is None:
+            return None
+        return {**self.instrumentation.snapshot(), "cache": self.cache_stats(), "hot": self.hot.snapshot() if self.hot else None}
+
+    def dump_diagnostics(self, path):
+        self.instrumentation.dump(path, {"cache": self.cache_stats(), "hot": self.hot.snapshot() if self.hot else None})
+
+    def explain_query_plan(self, sql):
+        # Plan of a traced (parameter-expanded) statement, as the detail lines EXPLAIN QUERY PLAN
+        # prints. A concurrent manager explains on a connection of its own so it never waits on
+        # the writer or a reader that is in use.
+        try:
+            with self.explain_lock:
+                if self.explain_conn is None:
+                    self.explain_conn = self.connect(self.db_name, check_same_thread=False) if self.concurrent else self.conn
+                return [row[3] for row in self.explain_conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        except sqlite3.Error as e:
+            return [f"not explained: {e}"]
 
     def create_table(self):
         with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS notes {self.NOTES_COLUMNS}")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(notes)")]
+        if "preview" not in columns:
+            self.rebuild_notes_table()
+        else:
+            with self.conn:
+                if "codec" not in columns:
+                    self.conn.execute("ALTER TABLE notes ADD COLUMN codec INTEGER NOT NULL DEFAULT 0")
+                for column, declaration in self.HASH_COLUMNS:
+                    if column not in columns:
+                        self.conn.execute(f"ALTER TABLE notes ADD COLUMN {column} {declaration}")
+        with self.conn:
+            # Covering index of ids only: COUNT(*) and OFFSET jumps walk this instead of every note body
+            self.conn.execute("CREATE INDEX IF NOT EXISTS notes_id_idx ON notes (id)")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS notes_content_hash_idx ON notes (content_hash)")
+            # Where each file import got to, committed with the notes it covers (see import_notes)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS import_checkpoints (path TEXT PRIMARY KEY, size INTEGER NOT NULL, offset INTEGER NOT NULL, updated REAL)"
+            )
+            self.create_preview_triggers()
+            # A body changed by another program would keep its old hash, and adding the old body
+            # again would then bump this note instead. The trigger clears the hash and queues the
+            # note for rehash_changed. compact re-encodes bodies unchanged and always sets codec.
+            self.conn.execute("CREATE TABLE IF NOT EXISTS notes_rehash (note_id INTEGER PRIMARY KEY)")
             self.conn.execute(
-                "CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, content TEXT NOT NULL)"
+                """CREATE TRIGGER IF NOT EXISTS notes_hash_update AFTER UPDATE OF content ON notes
+                    WHEN new.content IS NOT old.content AND new.content_hash IS old.content_hash
+                        AND new.codec IS old.codec AND new.content_hash IS NOT NULL BEGIN
+                    UPDATE notes SET content_hash = NULL WHERE id = new.id;
+                    INSERT OR IGNORE INTO notes_rehash (note_id) VALUES (new.id);
+                END"""
             )
 
-    def list_notes(self):
+    def rebuild_notes_table(self):
+        # Databases from before listing previews store (id, name, content). ALTER TABLE can only
+        # append columns after content, so copy the notes into a table with the current layout.
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(f"CREATE TABLE notes_rebuild {self.NOTES_COLUMNS}")
+            preview, length = self.preview_sql("notes")
+            self.conn.execute(
+                f"INSERT INTO notes_rebuild (id, name, preview, length, content) SELECT id, name, {preview}, {length}, content FROM notes"
+            )
+            # Keep the AUTOINCREMENT high-water mark so ids of deleted notes are never reused
+            sequence = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'notes'").fetchone()
+            self.conn.execute("DROP TABLE notes")
+            self.conn.execute("ALTER TABLE notes_rebuild RENAME TO notes")
+            if sequence:
+                self.conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'notes'", sequence)
+
+    def preview_sql(self, row):
+        # The preview and length of a plain TEXT body, as note_record computes them
+        return f"replace(substr({row}.content, 1, {self.PREVIEW_CHARS}), char(10), ' ')", f"length({row}.content)"
+
+    def create_preview_triggers(self):
+        # Other programs insert and edit notes without preview or length, which would list them
+        # empty or stale. The triggers only write when the stored values are off, so they cost a
+        # comparison on this manager's own writes. Notes written before them are fixed once.
+        preview, length = self.preview_sql("new")
+        # SQLite's length() stops at a NUL, so bodies holding one keep the values note_record gave them
+        stale = (
+            f"typeof(new.content) = 'text' AND instr(CAST(new.content AS BLOB), x'00') = 0 "
+            f"AND (new.preview IS NOT {preview} OR new.length IS NOT {length})"
+        )
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'notes_preview_insert'").fetchone()
+        for event in ("INSERT", "UPDATE OF content"):
+            self.conn.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS notes_preview_{event.split()[0].lower()} AFTER {event} ON notes WHEN {stale} BEGIN
+                    UPDATE notes SET preview = {preview}, length = {length} WHERE id = new.id;
+                END"""
+            )
+        if not exists:
+            preview, length = self.preview_sql("notes")
+            self.conn.execute(
+                f"UPDATE notes SET preview = {preview}, length = {length} "
+                f"WHERE typeof(content) = 'text' AND instr(CAST(content AS BLOB), x'00') = 0 "
+                f"AND (preview IS NOT {preview} OR length IS NOT {length})"
+            )
+
+    def note_record(self, name, content):
+        # Column values for INSERT_NOTE; the preview matches what rebuild_notes_table computes in SQL
+        codec, stored = encode_body(content, self.compression, self.compress_threshold)
+        return name, content[:self.PREVIEW_CHARS].replace("\n", " "), len(content), codec, content_hash(content), time.time(), stored, 1
+
+    def insert_notes(self, records, duplicates=None):
+        # Insert note_record rows under a duplicate policy, inside the caller's transaction.
+        # Existing hashes are looked up in one query per call, and duplicates within `records`
+        # count too. Returns (notes inserted, duplicates found).
+        duplicates = duplicates or self.duplicates
+        if duplicates not in self.DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {duplicates}")
+        self.rehash_changed()
+        hashes = list({record[4] for record in records})
+        seen = set()
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            seen.update(row[0] for row in self.conn.execute(
+                f"SELECT content_hash FROM notes WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        inserts = []
+        bumps = []
+        found = 0
+        for record in records:
+            if record[4] not in seen:
+                seen.add(record[4])
+                inserts.append(record)
+                continue
+            found += 1
+            if duplicates == "bump":
+                bumps.append((record[7], record[5], record[4]))
+            elif duplicates == "allow":
+                inserts.append((*record[:4], None, *record[5:]))
+        if len(inserts) >= self.BULK_INDEX_ROWS:
+            with self.bulk_indexing():
+                self.conn.executemany(self.INSERT_NOTE, inserts)
+        else:
+            self.conn.executemany(self.INSERT_NOTE, inserts)
+        # After the inserts, so a body repeated within `records` bumps the note just inserted
+        self.conn.executemany("UPDATE notes SET use_count = use_count + ?, last_seen = max(ifnull(last_seen, 0), ?) WHERE content_hash = ?", bumps)
+        self.index_queued()
+        return len(inserts), found
+
+    def rehash_changed(self):
+        # Hashes the notes notes_hash_update queued, inside the caller's transaction. A note whose
+        # new body is already stored keeps a NULL hash, like an "allow" duplicate, until dedupe.
+        rows = self.conn.execute(
+            "SELECT notes.id, notes.codec, notes.content FROM notes_rehash JOIN notes ON notes.id = notes_rehash.note_id"
+        ).fetchall()
+        hashed = 0
+        for note_id, codec, content in rows:
+            digest = content_hash(decode_body(codec, content))
+            if self.conn.execute("SELECT 1 FROM notes WHERE content_hash = ?", (digest,)).fetchone() is None:
+                self.conn.execute("UPDATE notes SET content_hash = ? WHERE id = ?", (digest, note_id))
+                hashed += 1
+        self.conn.execute("DELETE FROM notes_rehash")
+        return hashed
+
+    def text_indexes(self):
+        return [table for table, enabled in (("notes_fts", self.fts_enabled), ("notes_trigram", self.trigram_enabled)) if enabled]
+
+    @contextmanager
+    def bulk_indexing(self):
+        # Notes inserted in the block are indexed afterwards with one INSERT ... SELECT per index
+        # instead of row by row through the insert triggers. Every row a trigger writes is a
+        # statement of its own, and FTS5 flushes its pending terms to a new segment at each
+        # statement's savepoint, so bulk indexing a batch is about 2.5x faster. The triggers are
+        # dropped and recreated inside the caller's transaction, so no other connection ever
+        # sees them missing and a rollback restores them.
+        indexes = self.text_indexes()
+        if not indexes:
+            yield
+            return
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        last_id = self.conn.execute("SELECT coalesce(max(id), 0) FROM notes").fetchone()[0]
+        for table in (*indexes, "notes_index_queue"):
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {table}_insert")
+        yield
+        for table in indexes:
+            self.conn.execute(f"INSERT INTO {table} (rowid, name, content) SELECT id, name, content FROM notes_text WHERE id > ?", (last_id,))
+            self.create_index_triggers(table)
+        self.create_queue_triggers()
+
+    @staticmethod
+    def body_sql(row="notes"):
+        # SQL for a note's plain-text body; only compressed rows go through the note_body function
+        return f"CASE WHEN {row}.codec = 0 THEN {row}.content ELSE note_body({row}.codec, {row}.content) END"
+
+    def create_fts_index(self):
+        # External-content FTS5 index over notes, kept in sync by triggers.
+        # Older databases get the index created and backfilled the first time they are opened.
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            self.conn.execute("DROP TABLE temp.fts5_probe")
+        except sqlite3.OperationalError:
+            return False
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'").fetchone()
+        # The index reads note text through the notes_text view, which decompresses bodies. Indexes
+        # from before compression point straight at notes and are rebuilt once against the view.
+        has_view = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'notes_text'").fetchone()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            if exists and not has_view:
+                for trigger in ("notes_fts_insert", "notes_fts_delete", "notes_fts_update"):
+                    self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                self.conn.execute("DROP TABLE notes_fts")
+                exists = False
+            # Triggers from before the queue called note_body, which other programs don't have
+            for (trigger,) in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'notes' AND sql LIKE '%note_body%'"
+            ).fetchall():
+                self.conn.execute(f"DROP TRIGGER {trigger}")
+            self.conn.execute(f"CREATE VIEW IF NOT EXISTS notes_text AS SELECT id, name, {self.body_sql()} AS content FROM notes")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS notes_index_queue "
+                "(seq INTEGER PRIMARY KEY, action TEXT NOT NULL, note_id INTEGER NOT NULL, name TEXT, codec INTEGER, content)"
+            )
+            if not exists:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE notes_fts USING fts5(name, content, content='notes_text', content_rowid='id')"
+                )
+            self.create_index_triggers("notes_fts")
+            self.create_queue_triggers()
+            if not exists:
+                # The rebuild indexes every note as it is now, queued changes included
+                self.conn.execute("DELETE FROM notes_index_queue")
+                self.conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        return True
+
+    def create_index_triggers(self, table):
+        # Triggers keeping an external-content index over notes_text in step with every write.
+        # They go with the notes table, so they are (re)created whenever it was rebuilt. They are
+        # plain SQL, so any program can write to notes.db, and only index notes stored as plain
+        # TEXT; changes involving a compressed body are queued (see create_queue_triggers).
+        self.conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON notes WHEN typeof(new.content) = 'text' BEGIN
+                INSERT INTO {table} (rowid, name, content) VALUES (new.id, new.name, new.content);
+            END"""
+        )
+        self.conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON notes WHEN typeof(old.content) = 'text' BEGIN
+                INSERT INTO {table} ({table}, rowid, name, content) VALUES ('delete', old.id, old.name, old.content);
+            END"""
+        )
+        self.conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF name, content ON notes
+                WHEN typeof(old.content) = 'text' AND typeof(new.content) = 'text' BEGIN
+                INSERT INTO {table} ({table}, rowid, name, content) VALUES ('delete', old.id, old.name, old.content);
+                INSERT INTO {table} (rowid, name, content) VALUES (new.id, new.name, new.content);
+            END"""
+        )
+
+    def create_queue_triggers(self):
+        # Compressed bodies can only be read through note_body, so writes involving one are logged
+        # to notes_index_queue with the stored body, for index_queued to apply. An update with a
+        # compressed side queues both sides, keeping every change to a note in order.
+        self.conn.execute(
+            """CREATE TRIGGER IF NOT EXISTS notes_index_queue_insert AFTER INSERT ON notes WHEN typeof(new.content) != 'text' BEGIN
+                INSERT INTO notes_index_queue (action, note_id, name, codec, content) VALUES ('insert', new.id, new.name, new.codec, new.content);
+            END"""
+        )
+        self.conn.execute(
+            """CREATE TRIGGER IF NOT EXISTS notes_index_queue_delete AFTER DELETE ON notes WHEN typeof(old.content) != 'text' BEGIN
+                INSERT INTO notes_index_queue (action, note_id, name, codec, content) VALUES ('delete', old.id, old.name, old.codec, old.content);
+            END"""
+        )
+        self.conn.execute(
+            """CREATE TRIGGER IF NOT EXISTS notes_index_queue_update AFTER UPDATE OF name, content ON notes
+                WHEN typeof(old.content) != 'text' OR typeof(new.content) != 'text' BEGIN
+                INSERT INTO notes_index_queue (action, note_id, name, codec, content) VALUES ('delete', old.id, old.name, old.codec, old.content);
+                INSERT INTO notes_index_queue (action, note_id, name, codec, content) VALUES ('insert', new.id, new.name, new.codec, new.content);
+            END"""
+        )
+
+    def index_queued(self, conn=None, batch_size=500):
+        # Applies notes_index_queue to the text indexes in order, inside the caller's transaction.
+        # Every write of this manager calls it before committing; other programs' changes are
+        # applied when the database is next opened here or with the next write.
+        conn = conn or self.conn
+        indexes = self.text_indexes()
+        applied = 0
+        while indexes:
+            rows = conn.execute(
+                "SELECT seq, action, note_id, name, codec, content FROM notes_index_queue ORDER BY seq LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                break
+            for seq, action, note_id, name, codec, content in rows:
+                body = decode_body(codec, content)
+                for table in indexes:
+                    if action == "delete":
+                        conn.execute(f"INSERT INTO {table} ({table}, rowid, name, content) VALUES ('delete', ?, ?, ?)", (note_id, name, body))
+                    else:
+                        conn.execute(f"INSERT INTO {table} (rowid, name, content) VALUES (?, ?, ?)", (note_id, name, body))
+            conn.execute("DELETE FROM notes_index_queue WHERE seq <= ?", (rows[-1][0],))
+            applied += len(rows)
+        return applied
+
+    def create_trigram_index(self):
+        # Second external-content index over notes_text, tokenized into overlapping three-character
+        # sequences (SQLite 3.34+). Any substring of at least three characters is a phrase of its
+        # trigrams, so substring and fuzzy searches are index lookups instead of full scans.
+        if not self.fts_enabled:
+            return False
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+            self.conn.execute("DROP TABLE temp.trigram_probe")
+        except sqlite3.OperationalError:
+            return False
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_trigram'").fetchone()
         with self.conn:
-            cursor = self.conn.execute("SELECT id, name, content FROM notes")
+            self.conn.execute("BEGIN")
+            if not exists:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE notes_trigram USING fts5(name, content, content='notes_text', content_rowid='id', tokenize='trigram')"
+                )
+            self.create_index_triggers("notes_trigram")
+            if not exists:
+                # Queued changes go to the word index only; the rebuild covers them here
+                self.index_queued()
+                self.conn.execute("INSERT INTO notes_trigram (notes_trigram) VALUES ('rebuild')")
+        return True
+
+    def drop_trigram_index(self):
+        # For bulk imports (see import_notes): substring and fuzzy searches scan until
+        # create_trigram_index builds the index again, which also happens when the database is
+        # next opened. Other managers with the database open still expect the index.
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for event in ("insert", "delete", "update"):
+                self.conn.execute(f"DROP TRIGGER IF EXISTS notes_trigram_{event}")
+            self.conn.execute("DROP TABLE IF EXISTS notes_trigram")
+        self.trigram_enabled = False
+
+    @instrumented
+    @cached_query
+    def list_notes(self):
+        with self.reading() as conn:
+            cursor = conn.execute(f"SELECT {self.LISTING_COLUMNS} FROM notes")
             notes = cursor.fetchall()
             return notes
 
-    def add_note(self, name, content):
+    @instrumented
+    @cached_query
+    def count_notes(self):
+        with self.reading() as conn:
+            return conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    @instrumented
+    @cached_query
+    def list_notes_page(self, after_id=0, limit=100):
+        # Keyset pagination: cost depends on the page size, not on how deep into the table the page is
+        with self.reading() as conn:
+            cursor = conn.execute(f"SELECT {self.LISTING_COLUMNS} FROM notes WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+            return cursor.fetchall()
+
+    @instrumented
+    @cached_query
+    def note_id_at(self, offset):
+        # Id of the row at a given position, used to seed keyset pagination after a scrollbar jump
+        with self.reading() as conn:
+            row = conn.execute("SELECT id FROM notes ORDER BY id LIMIT 1 OFFSET ?", (offset,)).fetchone()
+            return row[0] if row else None
+
+    @instrumented
+    def list_notes_from(self, offset, limit=100):
+        after_id = self.note_id_at(offset - 1) if offset > 0 else 0
+        return self.list_notes_page(after_id, limit)
+
+    @instrumented
+    def get_note(self, note_id):
+        # Full (id, name, content) of one note, for editing and copying
+        with self.reading() as conn:
+            return conn.execute(f"SELECT id, name, {self.body_sql()} FROM notes WHERE id = ?", (note_id,)).fetchone()
+
+    @instrumented
+    @bumps_generation
+    @write_transaction()
+    def add_note(self, name, content, duplicates=None):
+        duplicates = duplicates or self.duplicates
         with self.conn:
-            self.conn.execute("INSERT INTO notes (name, content) VALUES (?, ?)", (name, content))
+            inserted, _ = self.insert_notes([self.note_record(name, content)], duplicates)
+        if inserted:
             return "Note added!"
+        if duplicates == "bump":
+            return "Note already saved; use count bumped."
+        return "Note already saved; duplicate skipped."
+
+    @instrumented
+    @bumps_generation
+    @write_transaction()
+    def add_notes(self, notes, duplicates=None):
+        # Several (name, content) notes in one transaction, e.g. a batch of clipboard captures.
+        # Returns (notes inserted, duplicates found).
+        records = [self.note_record(name, content) for name, content in notes]
+        with self.conn:
+            return self.insert_notes(records, duplicates)
 
+    @instrumented
+    @bumps_generation
+    @write_transaction()
     def update_note(self, note_id, name, content):
+        name, preview, length, codec, digest, last_seen, stored, _ = self.note_record(name, content)
         with self.conn:
-            self.conn.execute("UPDATE notes SET name = ?, content = ? WHERE id = ?", (name, content, note_id))
+            # Editing a note into a copy of another one keeps both, the same as the "allow" policy
+            if self.conn.execute("SELECT 1 FROM notes WHERE content_hash = ? AND id != ?", (digest, note_id)).fetchone():
+                digest = None
+            self.conn.execute(
+                "UPDATE notes SET name = ?, preview = ?, length = ?, codec = ?, content_hash = ?, last_seen = ?, content = ? WHERE id = ?",
+                (name, preview, length, codec, digest, last_seen, stored, note_id),
+            )
+            self.index_queued()
             return "Note updated!"
 
+    @instrumented
+    @bumps_generation
+    @write_transaction()
     def delete_note_by_id(self, note_id):
         with self.conn:
             cursor = self.conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
             if cursor.rowcount == 0:
                 return "Invalid note ID!"
+            self.index_queued()
             return "Note deleted!"
 
-    def search_notes(self, query):
+    def fts_query(self, query):
+        # Queries using FTS5 syntax (phrases, prefixes, AND/OR/NOT, column filters, ^) pass through untouched.
+        # Plain words become prefix phrases, so "host-01 err" matches "host-01.example" and "errors".
+        if self.FTS_SYNTAX.search(query):
+            return query
+        terms = ['"' + term.replace('"', '""') + '"*' for term in query.split()]
+        return " ".join(terms)
+
+    @staticmethod
+    def like_pattern(query):
+        # LIKE pattern matching query literally anywhere, for use with ESCAPE '\\'
+        return "%" + re.sub(r"([\\%_])", r"\\\1", query) + "%"
+
+    @staticmethod
+    def trigrams(query):
+        # The distinct trigrams the trigram tokenizer makes of query, which it folds to lower case
+        query = query.lower()
+        return sorted({query[i:i + 3] for i in range(len(query) - 2)})
+
+    def ranked_search(self, conn, table, match, limit, snippet_tokens, verify="", params=()):
+        # The `limit` best (id, name, snippet, length) matches of an FTS5 expression. FTS5 sorts
+        # by rank itself from the index alone, so only the notes returned are read, decompressed
+        # and cut into snippets; `verify` is an extra condition on those notes.
+        opening, closing = self.SNIPPET_MARKERS
+        return conn.execute(
+            f"SELECT notes.id, notes.name, replace(snippet({table}, 1, ?, ?, '…', {snippet_tokens}), char(10), ' '), notes.length "
+            f"FROM {table} JOIN notes ON notes.id = {table}.rowid WHERE {table} MATCH ? AND rank MATCH ?{verify} ORDER BY rank LIMIT ?",
+            (opening, closing, match, f"bm25({self.NAME_WEIGHT}, 1.0)", *params, limit),
+        ).fetchall()
+
+    def substring_search(self, query, limit):
+        # The best `limit` notes containing query in their name or body.
+        # A query of three or more characters is looked up as a phrase of its trigrams, which only
+        # matches where they follow each other, so the index alone is exact for ASCII. The index
+        # folds case across all of Unicode but LIKE only for ASCII, so other queries are verified
+        # against the text of the notes found. Shorter queries have no trigrams and scan,
+        # decompressing bodies as they go; they are not ranked and keep their previews.
+        pattern = self.like_pattern(query)
+        with self.reading() as conn:
+            if self.trigram_enabled and len(query) >= 3:
+                verify = "" if query.isascii() else f" AND (notes.name LIKE ? ESCAPE '\\' OR {self.body_sql()} LIKE ? ESCAPE '\\')"
+                return self.ranked_search(
+                    conn, "notes_trigram", '"' + query.replace('"', '""') + '"', limit, self.SNIPPET_CHARS,
+                    verify, () if query.isascii() else (pattern, pattern),
+                )
+            return conn.execute(
+                f"SELECT {self.LISTING_COLUMNS} FROM notes WHERE (name LIKE ? ESCAPE '\\' OR {self.body_sql()} LIKE ? ESCAPE '\\') "
+                "ORDER BY notes.id DESC LIMIT ?",
+                (pattern, pattern, limit),
+            ).fetchall()
+
+    def fuzzy_search(self, query, limit):
+        # Notes sharing the most trigrams with query, best first, so a mistyped hostname or ticket
+        # id still finds its note (see FUZZY_THRESHOLD). Counting happens in SQLite over posting
+        # lists of the query's rarest trigrams; note text is never read, so results keep their
+        # previews rather than snippets.
+        limit = min(limit, self.FUZZY_LIMIT)
+        grams = self.trigrams(query)
+        if not self.trigram_enabled or not grams:
+            return self.substring_search(query, limit)
+        share = max(1, self.FUZZY_POSTINGS // len(grams))
+        phrases = {gram: '"' + gram.replace('"', '""') + '"' for gram in grams}
+        with self.reading() as conn:
+            # Notes per trigram, counted no further than its share so a common one costs no more
+            # than a rare one (fts5vocab would walk every posting to count them)
+            docs = {
+                gram: conn.execute(
+                    "SELECT count(*) FROM (SELECT rowid FROM notes_trigram WHERE notes_trigram MATCH ? LIMIT ?)", (phrase, share + 1)
+                ).fetchone()[0]
+                for gram, phrase in phrases.items()
+            }
+            # Trigrams no note holds (typically the ones a typo made) count against every note
+            missing = sum(1 for count in docs.values() if not count)
+            counted = [gram for gram, count in docs.items() if 0 < count <= share]
+            if not counted:
+                # Nothing but common trigrams: only an exact match is worth ranking
+                return self.substring_search(query, limit)
+            needed = max(1, math.ceil(self.FUZZY_THRESHOLD * (len(counted) + missing)))
+            if len(counted) < needed:
+                return []
+            lists = " UNION ALL ".join(["SELECT rowid FROM notes_trigram WHERE notes_trigram MATCH ?"] * len(counted))
+            return conn.execute(
+                f"WITH hits (id, shared) AS (SELECT rowid, count(*) FROM ({lists}) GROUP BY rowid HAVING count(*) >= ? "
+                "ORDER BY 2 DESC, 1 DESC LIMIT ?) "
+                f"SELECT {self.LISTING_COLUMNS} FROM hits JOIN notes ON notes.id = hits.id ORDER BY hits.shared DESC, notes.id DESC",
+                [phrases[gram] for gram in counted] + [needed, limit],
+            ).fetchall()
+
+    @instrumented
+    @cached_query
+    def search_notes(self, query, mode="auto", limit=None):
+        # The best `limit` (default SEARCH_LIMIT) matches as (id, name, snippet, length), best first.
+        # mode: "auto" uses the full-text index and falls back to substring matching when the
+        # query can't be expressed in FTS5, "fts" uses the index only, "substring" matches
+        # fragments through the trigram index, and "fuzzy" ranks notes by trigram similarity.
+        if not query:
+            return self.list_notes()
+        limit = limit or self.SEARCH_LIMIT
+        if mode == "fuzzy":
+            return self.fuzzy_search(query, limit)
+        # Punctuation-only queries have no tokens to look up, so they can only be matched as substrings
+        if mode == "fts" or (mode == "auto" and self.fts_enabled and re.search(r"\w", query)):
+            try:
+                with self.reading() as conn:
+                    return self.ranked_search(conn, "notes_fts", self.fts_query(query), limit, self.SNIPPET_WORDS)
+            except sqlite3.OperationalError as e:
+                # An interrupted search was superseded by a newer one; don't follow it with a full scan
+                if mode == "fts" or str(e) == "interrupted":
+                    raise
+        return self.substring_search(query, limit)
+
+    def interrupt(self, thread_id=None):
+        # Safe to call from another thread: aborts the read that thread (by default the calling
+        # thread) is running. Writes are never interrupted this way.
+        conn = self.checked_out.get(thread_id or threading.get_ident())
+        if conn is not None:
+            conn.interrupt()
+
+    @instrumented
+    @bumps_generation
+    @write_transaction()
+    def load_notes_from_text(self, text, duplicates=None):
+        notes = [self.note_record(*split_note(note.strip())) for note in text.split('===') if note.strip()]
         with self.conn:
-            cursor = self.conn.execute("SELECT id, name, content FROM notes WHERE name LIKE ? OR content LIKE ?", ('%' + query + '%', '%' + query + '%'))
-            results = cursor.fetchall()
-            return results
+            inserted, found = self.insert_notes(notes, duplicates)
+        return f"Loaded {inserted} notes{self.duplicates_summary(found, duplicates)}."
+
+    def duplicates_summary(self, found, duplicates=None):
+        if not found:
+            return ""
+        if (duplicates or self.duplicates) == "bump":
+            return f", {found} duplicates skipped (use counts bumped)"
+        if (duplicates or self.duplicates) == "allow":
+            return f" ({found} of them duplicates)"
+        return f", {found} duplicates skipped"
+
+    @instrumented
+    @bumps_generation
+    @write_transaction(retry=False)
+    def import_notes_file(self, path, batch_size=1000, commit_every=100000, progress=None, duplicates=None):
+        # Bulk import of an ===-delimited export straight from disk. Notes are inserted with
+        # executemany in batches of batch_size and committed every commit_every notes, so a
+        # multi-GB file never sits in memory and an interruption keeps everything committed so far.
+        # Not retried when locked, since a retry would re-insert the batches already committed.
+        # progress(notes_done, bytes_done, total_bytes, notes_per_sec) is called after every batch.
+        total_bytes = os.path.getsize(path)
+        started = time.perf_counter()
+        count = 0
+        found = 0
+        processed = 0
+        uncommitted = 0
+        batch = []
+        position = 0
+        try:
+            for name, content, position in iter_note_file(path):
+                batch.append(self.note_record(name, content))
+                if len(batch) < batch_size:
+                    continue
+                inserted, duplicates_found = self.insert_notes(batch, duplicates)
+                count += inserted
+                found += duplicates_found
+                processed += len(batch)
+                uncommitted += len(batch)
+                batch.clear()
+                if uncommitted >= commit_every:
+                    self.conn.commit()
+                    self.write_generation += 1
+                    uncommitted = 0
+                if progress:
+                    progress(processed, position, total_bytes, processed / max(time.perf_counter() - started, 1e-9))
+            if batch:
+                inserted, duplicates_found = self.insert_notes(batch, duplicates)
+                count += inserted
+                found += duplicates_found
+                processed += len(batch)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        elapsed = time.perf_counter() - started
+        rate = processed / max(elapsed, 1e-9)
+        if progress:
+            progress(processed, total_bytes, total_bytes, rate)
+        return f"Imported {count} notes{self.duplicates_summary(found, duplicates)} in {elapsed:.1f}s ({rate:,.0f} notes/sec)."
+
+    @instrumented
+    def export_notes(self, path, format=None, batch_size=1000, progress=None):
+        # Streams every note, oldest first, to a JSONL or CSV file ("-" for stdout) in constant
+        # memory: rows come off the cursor batch_size at a time and bodies are decompressed one by
+        # one. A concurrent manager reads from one snapshot, so writes during the export don't tear it.
+        # format defaults to the file extension (see export_format).
+        # progress(notes_done, notes_per_sec) is called after every batch.
+        format = format or export_format(path)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        started = time.perf_counter()
+        count = 0
+        output = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        try:
+            writer = csv.writer(output) if format == "csv" else None
+            if writer:
+                writer.writerow(EXPORT_FIELDS)
+            with self.reading() as conn:
+                cursor = conn.execute("SELECT id, name, codec, content, use_count, last_seen FROM notes ORDER BY id")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    records = [
+                        (note_id, name, decode_body(codec, content), use_count, last_seen)
+                        for note_id, name, codec, content, use_count, last_seen in rows
+                    ]
+                    if writer:
+                        writer.writerows(records)
+                    else:
+                        output.write("".join(export_line(*record) for record in records))
+                    count += len(rows)
+                    if progress:
+                        progress(count, count / max(time.perf_counter() - started, 1e-9))
+        finally:
+            if output is sys.stdout:
+                output.flush()
+            else:
+                output.close()
+        elapsed = time.perf_counter() - started
+        return {"notes": count, "format": format, "seconds": round(elapsed, 3), "notes_per_sec": round(count / max(elapsed, 1e-9))}
+
+    def import_record(self, fields):
+        # note_record for one exported note, keeping its last_seen and use_count when the export has them
+        if fields.get("content") is None:
+            raise ValueError(f"Exported note without content: {fields.get('name')!r}")
+        name, preview, length, codec, digest, last_seen, stored, use_count = self.note_record(fields.get("name") or "Untitled", fields["content"])
+        if fields.get("last_seen") not in (None, ""):
+            last_seen = float(fields["last_seen"])
+        if fields.get("use_count") not in (None, ""):
+            use_count = int(fields["use_count"])
+        return name, preview, length, codec, digest, last_seen, stored, use_count
+
+    @instrumented
+    @bumps_generation
+    @write_transaction(retry=False)
+    def import_notes(self, path, format=None, offset=None, batch_size=1000, commit_every=10000, progress=None, duplicates=None, trigram=True):
+        # Imports a JSONL or CSV export (see export_notes) in batches of batch_size, committing
+        # every commit_every notes together with the byte offset reached in import_checkpoints.
+        # After an interruption the same call resumes from the last commit with nothing lost or
+        # imported twice, and a file that only grew since (an appended log) imports the new notes.
+        # offset overrides the checkpoint; 0 starts over.
+        # progress(notes_done, bytes_done, total_bytes, notes_per_sec) is called after every batch.
+        # trigram=False drops the trigram index for the import and rebuilds it in one pass at the
+        # end, which is cheaper than indexing batch by batch; see drop_trigram_index.
+        format = format or export_format(path)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown import format: {format}")
+        key = os.path.abspath(path)
+        total_bytes = os.path.getsize(path)
+        if offset is None:
+            row = self.conn.execute("SELECT offset FROM import_checkpoints WHERE path = ?", (key,)).fetchone()
+            # A file smaller than the checkpoint was replaced, not appended to
+            offset = row[0] if row and row[0] <= total_bytes else 0
+        resumed_at = offset
+        started = time.perf_counter()
+        count = 0
+        found = 0
+        processed = 0
+        uncommitted = 0
+        batch = []
+        position = offset
+        rebuild_trigram = not trigram and self.trigram_enabled
+        if rebuild_trigram:
+            self.drop_trigram_index()
+
+        def flush():
+            nonlocal count, found, processed, uncommitted
+            inserted, duplicates_found = self.insert_notes(batch, duplicates)
+            count += inserted
+            found += duplicates_found
+            processed += len(batch)
+            uncommitted += len(batch)
+            batch.clear()
+
+        def checkpoint():
+            nonlocal uncommitted
+            self.conn.execute(
+                "INSERT OR REPLACE INTO import_checkpoints (path, size, offset, updated) VALUES (?, ?, ?, ?)",
+                (key, total_bytes, position, time.time()),
+            )
+            self.conn.commit()
+            self.write_generation += 1
+            uncommitted = 0
+
+        try:
+            for fields, position in iter_export_file(path, format, offset):
+                batch.append(self.import_record(fields))
+                if len(batch) < batch_size:
+                    continue
+                flush()
+                if uncommitted >= commit_every:
+                    checkpoint()
+                if progress:
+                    progress(processed, position, total_bytes, processed / max(time.perf_counter() - started, 1e-9))
+            if batch:
+                flush()
+            position = max(position, total_bytes)
+            checkpoint()
+        except BaseException:
+            # Back to the last checkpoint, which the next call resumes from
+            self.conn.rollback()
+            raise
+        result = {"imported": count, "duplicates": found, "resumed_at": resumed_at, "offset": position}
+        if rebuild_trigram:
+            rebuild_started = time.perf_counter()
+            self.trigram_enabled = self.create_trigram_index()
+            result["trigram_seconds"] = round(time.perf_counter() - rebuild_started, 3)
+        elapsed = time.perf_counter() - started
+        rate = processed / max(elapsed, 1e-9)
+        if progress:
+            progress(processed, total_bytes, total_bytes, rate)
+        return {**result, "seconds": round(elapsed, 3), "notes_per_sec": round(rate)}
+
+    def database_size(self):
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
 
-    def load_notes_from_text(self, text):
-        notes = [note.strip() for note in text.split('===') if note.strip()]
+    @instrumented
+    @bumps_generation
+    @write_transaction(retry=False)
+    def compact(self, compression=None, vacuum=True, batch_size=500):
+        # One-shot migration of existing notes to the current compression settings (or another codec):
+        # bodies are re-encoded in id order, committed per batch, and the file is vacuumed afterwards
+        # so the space saved is returned to the filesystem.
+        compression = compression or self.compression
+        size_before = self.database_size()
+        started = time.perf_counter()
+        converted = 0
+        last_id = 0
+        while True:
+            # length counts characters, and a character is at most 4 bytes in UTF-8
+            rows = self.conn.execute(
+                "SELECT id, codec, content FROM notes WHERE id > ? AND (length * 4 >= ? OR codec != 0) ORDER BY id LIMIT ?",
+                (last_id, self.compress_threshold, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for note_id, codec, content in rows:
+                new_codec, stored = encode_body(decode_body(codec, content), compression, self.compress_threshold)
+                if new_codec != codec:
+                    updates.append((new_codec, stored, note_id))
+            with self.conn:
+                self.conn.executemany("UPDATE notes SET codec = ?, content = ? WHERE id = ?", updates)
+                self.index_queued()
+            converted += len(updates)
+            last_id = rows[-1][0]
+        if vacuum:
+            self.conn.execute("VACUUM")
+        return {
+            "notes_converted": converted,
+            "bytes_before": size_before,
+            "bytes_after": self.database_size(),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    @instrumented
+    @bumps_generation
+    @write_transaction(retry=False)
+    def dedupe(self, batch_size=500):
+        # One-time pass for databases from before content hashing: notes without a hash are hashed
+        # in id order, and each later copy of a body is folded into the first one (use counts are
+        # added up, the latest last_seen is kept) and deleted. Duplicates kept with the "allow"
+        # policy and notes changed by other programs have no hash either, so they are merged too.
+        started = time.perf_counter()
+        hashed = merged = 0
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, codec, content, use_count, last_seen FROM notes WHERE id > ? AND content_hash IS NULL ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            with self.conn:
+                for note_id, codec, content, use_count, last_seen in rows:
+                    digest = content_hash(decode_body(codec, content))
+                    keeper = self.conn.execute("SELECT id FROM notes WHERE content_hash = ?", (digest,)).fetchone()
+                    if keeper is None:
+                        self.conn.execute("UPDATE notes SET content_hash = ? WHERE id = ?", (digest, note_id))
+                        hashed += 1
+                        continue
+                    self.conn.execute(
+                        "UPDATE notes SET use_count = use_count + ?, last_seen = nullif(max(ifnull(last_seen, 0), ifnull(?, 0)), 0) WHERE id = ?",
+                        (use_count, last_seen, keeper[0]),
+                    )
+                    self.conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+                    merged += 1
+                self.index_queued()
+            last_id = rows[-1][0]
         with self.conn:
-            for note in notes:
-                if '\n' in note:
-                    name, content = note.split('\n', 1)
-                else:
-                    name, content = "Untitled", note
-                self.conn.execute("INSERT INTO notes (name, content) VALUES (?, ?)", (name.strip(), content.strip()))
-        return f"Loaded {len(notes)} notes."
+            self.conn.execute("DELETE FROM notes_rehash")
+        return {"notes_hashed": hashed, "duplicates_merged": merged, "seconds": round(time.perf_counter() - started, 3)}
+
+    @instrumented
+    def storage_report(self, sample=200):
+        # Stored size per codec against the plain-text size of the same notes, plus the average time
+        # get_note takes for a sample of plain and of compressed notes
+        names = {0: "plain", **{number: name for name, number in CODECS.items()}}
+        report = {"file_bytes": self.database_size(), "codecs": {}, "read_ms": {}}
+        with self.reading() as conn:
+            rows = conn.execute(
+                "SELECT codec, COUNT(*), SUM(length), SUM(length(CAST(content AS BLOB))) FROM notes GROUP BY codec"
+            ).fetchall()
+            for codec, notes, chars, stored_bytes in rows:
+                report["codecs"][names.get(codec, codec)] = {"notes": notes, "chars": chars, "stored_bytes": stored_bytes}
+                ids = [row[0] for row in conn.execute("SELECT id FROM notes WHERE codec = ? LIMIT ?", (codec, sample))]
+                started = time.perf_counter()
+                for note_id in ids:
+                    self.get_note(note_id)
+                report["read_ms"][names.get(codec, codec)] = round(1000 * (time.perf_counter() - started) / max(len(ids), 1), 3)
+        return report
+
+class DBWorker:
+    # Runs NoteManager calls on a dedicated thread that owns its own connection, so slow queries
+    # and imports never block the Tk main loop. submit() returns a concurrent.futures.Future;
+    # callbacks are run on the Tk thread by polling a result queue with root.after.
+    # Requests submitted with a key supersede the previous request with the same key: it is
+    # cancelled if it hasn't started yet, interrupted if it is running, and its callback is
+    # dropped if it has already finished. Each future gets an `elapsed` time spent in the call.
+    # With a concurrent NoteManager, reads get a lane (thread) of their own next to the write
+    # lane, so searches and page fetches don't queue up behind a long import.
+    def __init__(self, root, db_name="notes.db", poll_ms=16, **manager_options):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.lanes = {"write": queue.Queue()}
+        if manager_options.get("concurrent"):
+            self.lanes["read"] = queue.Queue()
+        self.results = queue.Queue()
+        self.latest = {}
+        self.manager = None
+        self.ready = threading.Event()
+        self.running = {}
+        self.running_lock = threading.Lock()
+        self.threads = []
+        for lane in self.lanes:
+            thread = threading.Thread(target=self.run, args=(lane, db_name, manager_options), name=f"DBWorker-{lane}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.root.after(self.poll_ms, self.poll)
+
+    def lane_for(self, method):
+        writes = getattr(getattr(NoteManager, method, None), "writes", False)
+        return "read" if "read" in self.lanes and not writes else "write"
+
+    def submit(self, method, *args, key=None, callback=None, **kwargs):
+        future = Future()
+        if key is not None:
+            self.cancel(key)
+            self.latest[key] = future
+        self.lanes[self.lane_for(method)].put((future, key, callback, method, args, kwargs))
+        return future
+
+    def cancel(self, key):
+        previous = self.latest.pop(key, None)
+        if previous is not None and not previous.cancel():
+            with self.running_lock:
+                for future, thread_id in self.running.values():
+                    if future is previous:
+                        self.manager.interrupt(thread_id)
+
+    def call_soon(self, function, *args):
+        # Thread-safe way for worker-side code (e.g. progress callbacks) to run something on the Tk thread
+        self.results.put((function, args))
+
+    def run(self, lane, db_name, manager_options):
+        if lane == "write":
+            try:
+                self.manager = NoteManager(db_name, **manager_options)
+            finally:
+                self.ready.set()
+        else:
+            self.ready.wait()
+        requests = self.lanes[lane]
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            future, key, callback, method, args, kwargs = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self.running_lock:
+                self.running[lane] = (future, threading.get_ident())
+            started = time.perf_counter()
+            try:
+                result = getattr(self.manager, method)(*args, **kwargs)
+            except Exception as e:
+                result = e
+            # Clear `running` before the next request starts so a late interrupt can't hit it
+            with self.running_lock:
+                del self.running[lane]
+            future.elapsed = time.perf_counter() - started
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+            self.results.put((self.deliver, (future, key, callback)))
+        if lane == "write" and self.manager:
+            self.manager.close()
+
+    def deliver(self, future, key, callback):
+        if key is not None:
+            if self.latest.get(key) is not future:
+                return
+            del self.latest[key]
+        if callback:
+            callback(future)
+
+    def poll(self):
+        # Rescheduled even if a callback raises, so one failing callback doesn't stop delivery
+        try:
+            while True:
+                try:
+                    function, args = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                function(*args)
+        finally:
+            self.root.after(self.poll_ms, self.poll)
+
+    def close(self, timeout=30.0):
+        # Requests already submitted still run; this waits up to `timeout` seconds for them and for
+        # the manager to close, since the lane threads are daemons and die with the interpreter.
+        # Returns False if a lane was still busy when the time ran out.
+        for requests in self.lanes.values():
+            requests.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self.threads)
+
+class VirtualTable:
+    # Presents the whole notes table in a Treeview while only inserting the rows in the viewport.
+    # A buffer of rows either side is kept in Python and refilled by keyset-paginated queries,
+    # and the scrollbar is driven by row offsets out of count_notes() rather than by the Treeview.
+    # Queries go through the DBWorker; a page request supersedes any page still in flight.
+    def __init__(self, tree, scrollbar, worker, buffer=50):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.worker = worker
+        self.buffer = buffer
+        self.visible = 20
+        self.total = 0
+        self.offset = 0
+        self.cache_start = 0
+        self.cache = []
+        self.active = False
+        self.rows = TreeRows(tree)
+
+    def refresh(self):
+        self.active = True
+        self.worker.submit("count_notes", key="count", callback=self.on_count)
+
+    def on_count(self, future):
+        if future.exception() or not self.active:
+            return
+        self.total = future.result()
+        self.cache = []
+        self.scroll_to(self.offset)
+
+    def resize(self, height):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible = max(1, (height - 25) // row_height)
+        if visible != self.visible:
+            self.visible = visible
+            if self.active:
+                self.scroll_to(self.offset)
+
+    def yview(self, *args):
+        # Scrollbar command protocol: ("moveto", fraction) or ("scroll", n, "units" | "pages")
+        if args[0] == "moveto":
+            offset = int(float(args[1]) * self.total)
+        else:
+            step = int(args[1]) * (self.visible if args[2] == "pages" else 1)
+            offset = self.offset + step
+        self.scroll_to(offset)
+
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+        return "break"
+
+    def scroll_to(self, offset):
+        self.offset = offset = max(0, min(offset, self.total - self.visible))
+        end = min(offset + self.visible, self.total)
+        if offset < self.cache_start or end > self.cache_start + len(self.cache):
+            self.fetch(offset)
+        else:
+            self.render(self.cache[offset - self.cache_start:end - self.cache_start])
+        if self.total:
+            self.scrollbar.set(offset / self.total, end / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def fetch(self, offset):
+        start = max(0, offset - self.buffer)
+        limit = self.visible + 2 * self.buffer
+        if self.cache and self.cache_start < start <= self.cache_start + len(self.cache):
+            after_id = self.cache[start - self.cache_start - 1][0]
+            self.worker.submit("list_notes_page", after_id, limit, key="page", callback=lambda f: self.on_page(f, start))
+        else:
+            self.worker.submit("list_notes_from", start, limit, key="page", callback=lambda f: self.on_page(f, start))
+
+    def on_page(self, future, start):
+        if future.exception() or not self.active:
+            return
+        self.cache = future.result()
+        self.cache_start = start
+        self.scroll_to(self.offset)
+
+    def render(self, notes):
+        self.rows.update(notes)
+
+class ClipboardCapture:
+    # Saves everything copied to the clipboard as a note named clipboard_<epoch ms>, the way the
+    # clipboard_*.txt files were saved by hand. The clipboard is read on the Tk thread with
+    # root.after every interval_ms. Only a hash of the last contents is kept, so an unchanged
+    # clipboard costs one read and an integer compare, and polling never slows down: a slower
+    # poll after a quiet spell would let the second copy of a burst overwrite the first unseen.
+    # Captures are buffered and written by the DB worker, one transaction per batch of
+    # batch_size or per flush_ms, so the UI never waits on the database. A poll only sees what
+    # is on the clipboard at that moment, so copies are all caught when at least interval_ms apart.
+    def __init__(self, root, worker, interval_ms=200, flush_ms=1000, batch_size=100, on_saved=None):
+        self.root = root
+        self.worker = worker
+        self.interval_ms = interval_ms
+        self.flush_ms = flush_ms
+        self.batch_size = batch_size
+        self.on_saved = on_saved
+        self.last_hash = None
+        self.pending = []
+        self.poll_id = None
+        self.flush_id = None
+        self.stats = {"captured": 0, "saved": 0, "duplicates": 0, "errors": 0, "last_error": None}
+
+    @property
+    def running(self):
+        return self.poll_id is not None
+
+    def start(self):
+        if self.poll_id is None:
+            # Whatever is on the clipboard already was copied before capture started
+            self.last_hash = self.clipboard_hash(self.read())
+            self.poll_id = self.root.after(self.interval_ms, self.poll)
+
+    def stop(self):
+        # Stops polling; captures not yet written are flushed, ahead of any later worker requests
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.flush()
+
+    def read(self):
+        try:
+            return self.root.clipboard_get()
+        except tk.TclError:
+            # Empty, or holding something other than text
+            return None
+
+    @staticmethod
+    def clipboard_hash(content):
+        return None if content is None else hash(content)
+
+    def poll(self):
+        content = self.read()
+        digest = self.clipboard_hash(content)
+        if digest != self.last_hash:
+            self.last_hash = digest
+            if content and content.strip():
+                self.capture(content)
+        self.poll_id = self.root.after(self.interval_ms, self.poll)
+
+    def capture(self, content):
+        self.pending.append((f"clipboard_{time.time_ns() // 1_000_000}", content))
+        self.stats["captured"] += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_id is None:
+            self.flush_id = self.root.after(self.flush_ms, self.flush)
+
+    def flush(self):
+        if self.flush_id is not None:
+            self.root.after_cancel(self.flush_id)
+            self.flush_id = None
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self.worker.submit("add_notes", batch, callback=lambda future: self.on_flushed(future, batch))
+
+    def on_flushed(self, future, batch):
+        inserted = found = 0
+        if future.exception():
+            # Kept and retried with the next flush rather than dropped, e.g. after a lock timeout
+            self.stats["errors"] += 1
+            self.stats["last_error"] = str(future.exception())
+            self.pending[:0] = batch
+            if self.flush_id is None:
+                self.flush_id = self.root.after(self.flush_ms, self.flush)
+        else:
+            inserted, found = future.result()
+            self.stats["last_error"] = None
+            self.stats["saved"] += inserted
+            self.stats["duplicates"] += found
+        if self.on_saved:
+            self.on_saved(inserted, found)
 
 class NoteApp:
-    def __init__(self, root):
-        self.manager = NoteManager()
+    SEARCH_MODES = {"Full text": "auto", "Substring": "substring", "Fuzzy": "fuzzy"}
+    SEARCH_DEBOUNCE_MS = 200
+    CACHE_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, root, db_name="notes.db", instrument=False, slow_query_ms=100, stats_file=None, hot=False, capture=False, capture_ms=200):
         self.theme_manager = ThemeManager()
         self.root = root
+        self.stats_file = stats_file
+        self.worker = DBWorker(root, db_name, cache_bytes=self.CACHE_BYTES, concurrent=True, instrument=instrument, slow_query_ms=slow_query_ms, hot=hot)
+        self.capture = ClipboardCapture(root, self.worker, interval_ms=capture_ms, on_saved=self.on_captured)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.root.title("Note Manager")
         self.root.geometry("1000x700")
+        self.style = ttk.Style(self.root)
+        # Classic Tk widgets that ttk styles don't reach (see apply_theme)
+        self.classic_widgets = [self.root]
         self.apply_theme()
 
         # Theme Selection Menu
@@ -110,63 +2067,93 @@ class NoteApp:
 
         # UI Elements
         self.create_widgets()
+        self.list_notes()
+        if capture:
+            self.capture_var.set(True)
+            self.toggle_capture()
 
     def create_widgets(self):
         # Header Frame
-        self.header_frame = tk.Frame(self.root, bg=self.theme_manager.get_theme()["bg"])
+        self.header_frame = ttk.Frame(self.root)
         self.header_frame.grid(row=0, column=0, columnspan=3, sticky="ew", padx=10, pady=10)
 
-        self.header_label = tk.Label(self.header_frame, text="Note Manager", font=("Arial", 16, "bold"), bg="#4CAF50", fg="white")
+        self.header_label = ttk.Label(self.header_frame, text="Note Manager", style="Header.TLabel")
         self.header_label.pack(pady=10)
 
         # Input Frame
-        self.input_frame = tk.Frame(self.root, bg=self.theme_manager.get_theme()["bg"])
+        self.input_frame = ttk.Frame(self.root)
         self.input_frame.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
 
-        self.name_label = tk.Label(self.input_frame, text="Note Name:", font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        self.name_label = ttk.Label(self.input_frame, text="Note Name:")
         self.name_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 
         self.name_entry = ttk.Entry(self.input_frame, width=50)
         self.name_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
 
-        self.content_label = tk.Label(self.input_frame, text="Note Content:", font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        self.content_label = ttk.Label(self.input_frame, text="Note Content:")
         self.content_label.grid(row=1, column=0, padx=5, pady=5, sticky="w")
 
-        self.content_text = ScrolledText(self.input_frame, height=10, width=60, font=("Arial", 10), wrap=tk.WORD, bg=self.theme_manager.get_theme()["entry_bg"], fg=self.theme_manager.get_theme()["entry_fg"])
+        self.content_text = self.themed(ScrolledText(self.input_frame, height=10, width=60, font=("Arial", 10), wrap=tk.WORD))
         self.content_text.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
 
         self.add_button = ttk.Button(self.input_frame, text="Add Note", command=self.add_note)
         self.add_button.grid(row=2, column=1, padx=5, pady=5, sticky="e")
 
         # Search Frame
-        self.search_frame = tk.Frame(self.root, bg=self.theme_manager.get_theme()["bg"])
+        self.search_frame = ttk.Frame(self.root)
         self.search_frame.grid(row=2, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
 
-        self.search_label = tk.Label(self.search_frame, text="Search:", font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        self.search_label = ttk.Label(self.search_frame, text="Search:")
         self.search_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 
-        self.search_entry = ttk.Entry(self.search_frame, width=50)
+        # Search as you type: edits are debounced, Enter searches immediately
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.search_frame, width=50, textvariable=self.search_var)
         self.search_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.search_entry.bind("<Return>", lambda e: self.search_notes())  # Search on Enter key
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        self.search_after_id = None
+        self.search_latencies = deque(maxlen=200)
 
         self.search_button = ttk.Button(self.search_frame, text="🔍", command=self.search_notes)
         self.search_button.grid(row=0, column=2, padx=5, pady=5, sticky="w")
 
+        # Full-text search by default; substring mode finds fragments of words and fuzzy mode tolerates typos
+        self.search_mode_var = tk.StringVar(value="Full text")
+        self.search_mode_menu = ttk.Combobox(self.search_frame, textvariable=self.search_mode_var, values=list(self.SEARCH_MODES.keys()), width=10, state="readonly")
+        self.search_mode_menu.grid(row=0, column=3, padx=5, pady=5, sticky="w")
+        self.search_mode_menu.bind("<<ComboboxSelected>>", lambda e: self.search_notes())
+
+        self.search_latency_label = ttk.Label(self.search_frame, text="", style="Small.TLabel")
+        self.search_latency_label.grid(row=0, column=4, padx=5, pady=5, sticky="w")
+
         # Table Frame
-        self.table_frame = tk.Frame(self.root, bg=self.theme_manager.get_theme()["bg"])
+        self.table_frame = ttk.Frame(self.root)
         self.table_frame.grid(row=3, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
 
-        self.tree = ttk.Treeview(self.table_frame, columns=("ID", "Name", "Content", "Copy"), show="headings", selectmode="browse")
+        self.tree = ttk.Treeview(self.table_frame, columns=("ID", "Name", "Content", "Size", "Copy"), show="headings", selectmode="browse")
         self.tree.heading("ID", text="ID")
         self.tree.heading("Name", text="Name")
         self.tree.heading("Content", text="Content")
+        self.tree.heading("Size", text="Size")
         self.tree.heading("Copy", text="📋")
         self.tree.column("ID", width=50, anchor="center")
         self.tree.column("Name", width=150, anchor="w")
-        self.tree.column("Content", width=500, anchor="w")
+        self.tree.column("Content", width=450, anchor="w")
+        self.tree.column("Size", width=70, anchor="e")
         self.tree.column("Copy", width=50, anchor="center")
+
+        # The scrollbar is driven either by the Treeview itself (search results) or by the
+        # virtual table (full listing), depending on which one is showing
+        self.scrollbar = ttk.Scrollbar(self.table_frame, orient=tk.VERTICAL)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.pack(fill=tk.BOTH, expand=True)
 
+        self.virtual_table = VirtualTable(self.tree, self.scrollbar, self.worker)
+        self.tree.bind("<Configure>", lambda e: self.virtual_table.resize(e.height))
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self.on_mousewheel)
+
         # Bind double-click to edit
         self.tree.bind("<Double-1>", self.edit_note)
 
@@ -174,7 +2161,7 @@ class NoteApp:
         self.tree.bind("<Button-1>", self.handle_table_click)
 
         # Action Buttons
-        self.action_frame = tk.Frame(self.root, bg=self.theme_manager.get_theme()["bg"])
+        self.action_frame = ttk.Frame(self.root)
         self.action_frame.grid(row=4, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
 
         self.load_button = ttk.Button(self.action_frame, text="Load Notes", command=self.load_notes)
@@ -183,113 +2170,252 @@ class NoteApp:
         self.delete_button = ttk.Button(self.action_frame, text="Delete Note", command=self.delete_note)
         self.delete_button.pack(side=tk.LEFT, padx=5)
 
+        self.diagnostics_button = ttk.Button(self.action_frame, text="Diagnostics", command=self.show_diagnostics)
+        self.diagnostics_button.pack(side=tk.RIGHT, padx=5)
+
+        # Clipboard capture: everything copied while it is on is saved as a note
+        self.capture_var = tk.BooleanVar(value=False)
+        self.capture_check = ttk.Checkbutton(self.action_frame, text="Capture clipboard", variable=self.capture_var, command=self.toggle_capture)
+        self.capture_check.pack(side=tk.LEFT, padx=5)
+
+        self.capture_label = ttk.Label(self.action_frame, text="", style="Small.TLabel")
+        self.capture_label.pack(side=tk.LEFT, padx=5)
+
         # Configure grid weights
         self.root.grid_rowconfigure(3, weight=1)
         self.root.grid_columnconfigure(1, weight=1)
 
     def apply_theme(self):
+        # Each theme becomes a named ttk theme the first time it is used, so switching is one
+        # theme_use call however many widgets are open. Classic Tk widgets (the root, Toplevels
+        # and Text) get their colours from the option database when they are created, and the
+        # ones already open are recoloured directly; there are only ever a handful of those.
         theme = self.theme_manager.get_theme()
-        self.root.configure(bg=theme["bg"])
-        for widget in self.root.winfo_children():
-            self.update_widget_theme(widget, theme)
-
-    def update_widget_theme(self, widget, theme):
-        if isinstance(widget, (tk.Frame, ttk.Frame)):
-            widget.configure(bg=theme["bg"])
-        elif isinstance(widget, (tk.Label, ttk.Label)):
-            widget.configure(bg=theme["bg"], fg=theme["fg"])
-        elif isinstance(widget, (tk.Entry, ttk.Entry)):
-            widget.configure(background=theme["entry_bg"], foreground=theme["entry_fg"])
-        elif isinstance(widget, (tk.Button, ttk.Button)):
-            widget.configure(background=theme["button_bg"], foreground=theme["button_fg"])
-        elif isinstance(widget, ttk.Treeview):
-            widget.configure(style="Treeview")
-            self.style.configure("Treeview", background=theme["tree_bg"], foreground=theme["tree_fg"], fieldbackground=theme["tree_bg"])
-            self.style.configure("Treeview.Heading", background=theme["tree_heading_bg"], foreground=theme["tree_heading_fg"])
-        for child in widget.winfo_children():
-            self.update_widget_theme(child, theme)
+        style_name = self.theme_manager.style_name()
+        if style_name not in self.style.theme_names():
+            self.style.theme_create(style_name, parent="clam", settings=self.theme_manager.style_settings())
+        self.style.theme_use(style_name)
+        for pattern, value in (
+            ("*Toplevel.background", theme["bg"]),
+            ("*Text.background", theme["entry_bg"]),
+            ("*Text.foreground", theme["entry_fg"]),
+            ("*Text.insertBackground", theme["entry_fg"]),
+            ("*TCombobox*Listbox.background", theme["entry_bg"]),
+            ("*TCombobox*Listbox.foreground", theme["entry_fg"]),
+        ):
+            self.root.option_add(pattern, value)
+        self.classic_widgets = [widget for widget in self.classic_widgets if widget.winfo_exists()]
+        for widget in self.classic_widgets:
+            if isinstance(widget, tk.Text):
+                widget.configure(background=theme["entry_bg"], foreground=theme["entry_fg"], insertbackground=theme["entry_fg"])
+            else:
+                widget.configure(background=theme["bg"])
+
+    def themed(self, widget):
+        # Register a classic Tk widget to be recoloured on theme changes; closed windows drop out
+        self.classic_widgets = [other for other in self.classic_widgets if other.winfo_exists()]
+        self.classic_widgets.append(widget)
+        return widget
 
     def change_theme(self, event=None):
         selected_theme = self.theme_var.get()
         self.theme_manager.set_theme(selected_theme)
         self.apply_theme()
 
+    def close(self):
+        # Pending captures are queued ahead of the worker's shutdown, and the window stays up until
+        # the worker has written them and closed the database (or gave up after its timeout)
+        self.capture.stop()
+        if self.stats_file and self.worker.manager is not None:
+            self.worker.manager.dump_diagnostics(self.stats_file)
+        if not self.worker.close():
+            print("note6: database writes were still running at exit and may be lost", file=sys.stderr)
+        self.root.destroy()
+
+    def run_db(self, method, *args, key=None, on_done=None, **kwargs):
+        # Submit a NoteManager call to the worker; on_done(result) runs on the Tk thread
+        def callback(future):
+            if future.exception():
+                messagebox.showerror("Error", str(future.exception()))
+            elif on_done:
+                on_done(future.result())
+        return self.worker.submit(method, *args, key=key, callback=callback, **kwargs)
+
     def add_note(self):
         name = self.name_entry.get().strip()
         content = self.content_text.get("1.0", tk.END).strip()
         if name and content:
-            message = self.manager.add_note(name, content)
-            messagebox.showinfo("Info", message)
-            self.name_entry.delete(0, tk.END)
-            self.content_text.delete("1.0", tk.END)
-            self.list_notes()
+            def on_done(message):
+                messagebox.showinfo("Info", message)
+                self.name_entry.delete(0, tk.END)
+                self.content_text.delete("1.0", tk.END)
+                self.refresh_view()
+            self.run_db("add_note", name, content, on_done=on_done)
 
     def delete_note(self):
         selected_item = self.tree.selection()
         if selected_item:
             note_id = self.tree.item(selected_item, "values")[0]
-            message = self.manager.delete_note_by_id(note_id)
-            messagebox.showinfo("Info", message)
-            self.list_notes()
+            def on_done(message):
+                messagebox.showinfo("Info", message)
+                self.refresh_view()
+            self.run_db("delete_note_by_id", note_id, on_done=on_done)
+
+    def toggle_capture(self):
+        if self.capture_var.get():
+            self.capture.start()
+        else:
+            self.capture.stop()
+        self.show_capture_stats()
+
+    def on_captured(self, inserted, found):
+        self.show_capture_stats()
+        if inserted:
+            self.refresh_view()
+
+    def show_capture_stats(self):
+        stats = self.capture.stats
+        if not self.capture.running and not stats["captured"]:
+            self.capture_label.config(text="")
+            return
+        text = f"{stats['saved']} clips saved"
+        if stats["duplicates"]:
+            text += f", {stats['duplicates']} already saved"
+        if stats["last_error"]:
+            text += f" (retrying: {stats['last_error']})"
+        self.capture_label.config(text=text)
+
+    def schedule_search(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.SEARCH_DEBOUNCE_MS, self.search_notes)
 
     def search_notes(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
         query = self.search_entry.get().strip()
-        results = self.manager.search_notes(query)
-        self.update_table(results)
+        if not query:
+            # Cancel any search still in flight and go back to the virtualized full listing
+            self.worker.cancel("search")
+            self.list_notes()
+            return
+
+        def on_done(future):
+            if future.exception():
+                messagebox.showerror("Error", str(future.exception()))
+                return
+            self.record_search_latency(future.elapsed)
+            self.update_table(future.result())
+        self.worker.submit("search_notes", query, self.SEARCH_MODES[self.search_mode_var.get()], key="search", callback=on_done)
+
+    def record_search_latency(self, elapsed):
+        self.search_latencies.append(elapsed * 1000)
+        ordered = sorted(self.search_latencies)
+        p50 = ordered[int(0.50 * (len(ordered) - 1))]
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        self.search_latency_label.configure(text=f"{elapsed * 1000:.0f} ms (p50 {p50:.0f}, p95 {p95:.0f}, n={len(ordered)})")
 
     def load_notes(self):
-        load_window = tk.Toplevel(self.root)
+        load_window = self.themed(tk.Toplevel(self.root))
         load_window.title("Load Notes")
         load_window.geometry("600x400")
-        load_window.configure(bg=self.theme_manager.get_theme()["bg"])
 
-        text_area = ScrolledText(load_window, height=20, width=70, wrap=tk.WORD, font=("Arial", 10), bg=self.theme_manager.get_theme()["entry_bg"], fg=self.theme_manager.get_theme()["entry_fg"])
+        text_area = self.themed(ScrolledText(load_window, height=20, width=70, wrap=tk.WORD, font=("Arial", 10)))
         text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
 
+        def on_loaded(message):
+            messagebox.showinfo("Info", message)
+            load_window.destroy()
+            self.refresh_view()
+
         def save_notes():
             text = text_area.get("1.0", tk.END).strip()
             if text:
-                message = self.manager.load_notes_from_text(text)
-                messagebox.showinfo("Info", message)
-                load_window.destroy()
-                self.list_notes()
+                save_button.configure(state=tk.DISABLED)
+                self.run_db("load_notes_from_text", text, on_done=on_loaded)
 
         save_button = ttk.Button(load_window, text="Save Notes", command=save_notes)
         save_button.pack(pady=10)
 
+        progress_label = ttk.Label(load_window, text="")
+        progress_label.pack(pady=5)
+
+        def show_progress(count, position, total_bytes, rate):
+            if progress_label.winfo_exists():
+                percent = 100 * position / total_bytes if total_bytes else 100
+                progress_label.configure(text=f"{count:,} notes ({percent:.0f}%), {rate:,.0f} notes/sec")
+
+        def import_file():
+            path = filedialog.askopenfilename(parent=load_window, title="Import Notes File", filetypes=[("Text files", "*.txt"), ("All files", "*")])
+            if path:
+                save_button.configure(state=tk.DISABLED)
+                import_button.configure(state=tk.DISABLED)
+                # Progress is reported from the worker thread, so hop back onto the Tk thread to show it
+                progress = lambda *args: self.worker.call_soon(show_progress, *args)
+                self.run_db("import_notes_file", path, progress=progress, on_done=on_loaded)
+
+        import_button = ttk.Button(load_window, text="Import File...", command=import_file)
+        import_button.pack(pady=5)
+
     def list_notes(self):
-        notes = self.manager.list_notes()
-        self.update_table(notes)
+        # The full listing is virtualized; only search results are inserted into the Treeview in full
+        self.tree.heading("Content", text="Content")
+        self.tree.configure(yscrollcommand="")
+        self.scrollbar.configure(command=self.virtual_table.yview)
+        self.virtual_table.refresh()
+
+    def refresh_view(self):
+        # After a change, redo whatever is showing: the search results if there is a query,
+        # otherwise the full listing. Either way only the rows that changed are redrawn.
+        if self.search_entry.get().strip():
+            self.search_notes()
+        else:
+            self.list_notes()
 
     def update_table(self, notes):
-        self.tree.delete(*self.tree.get_children())
-        for note in notes:
-            note_id, name, content = note
-            self.tree.insert("", tk.END, values=(note_id, name, content, "📋"))
+        # Search results, best first, with the matched text «marked» in a snippet of each note
+        self.tree.heading("Content", text="Match")
+        self.virtual_table.active = False
+        self.tree.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.configure(command=self.tree.yview)
+        self.virtual_table.rows.update(notes)
+
+    def on_mousewheel(self, event):
+        if self.virtual_table.active:
+            return self.virtual_table.on_mousewheel(event)
 
     def edit_note(self, event):
         selected_item = self.tree.selection()
         if selected_item:
-            note_id, name, content, _ = self.tree.item(selected_item, "values")
-            self.open_edit_window(note_id, name, content)
+            note_id = self.tree.item(selected_item, "values")[0]
+            self.with_note(note_id, lambda note: self.open_edit_window(*note))
+
+    def with_note(self, note_id, on_done):
+        # Listings only carry a preview, so the full note is fetched by id when it is needed
+        def on_note(note):
+            if note is None:
+                messagebox.showinfo("Info", "Invalid note ID!")
+            else:
+                on_done(note)
+        self.run_db("get_note", note_id, on_done=on_note)
 
     def open_edit_window(self, note_id, name, content):
-        edit_window = tk.Toplevel(self.root)
+        edit_window = self.themed(tk.Toplevel(self.root))
         edit_window.title("Edit Note")
         edit_window.geometry("600x400")
-        edit_window.configure(bg=self.theme_manager.get_theme()["bg"])
 
-        name_label = tk.Label(edit_window, text="Note Name:", font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        name_label = ttk.Label(edit_window, text="Note Name:")
         name_label.pack(padx=10, pady=5, anchor="w")
 
         name_entry = ttk.Entry(edit_window, width=50)
         name_entry.pack(padx=10, pady=5, fill=tk.X)
         name_entry.insert(0, name)
 
-        content_label = tk.Label(edit_window, text="Note Content:", font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        content_label = ttk.Label(edit_window, text="Note Content:")
         content_label.pack(padx=10, pady=5, anchor="w")
 
-        content_text = ScrolledText(edit_window, height=10, width=60, font=("Arial", 10), wrap=tk.WORD, bg=self.theme_manager.get_theme()["entry_bg"], fg=self.theme_manager.get_theme()["entry_fg"])
+        content_text = self.themed(ScrolledText(edit_window, height=10, width=60, font=("Arial", 10), wrap=tk.WORD))
         content_text.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
         content_text.insert("1.0", content)
 
@@ -297,18 +2423,17 @@ class NoteApp:
             new_name = name_entry.get().strip()
             new_content = content_text.get("1.0", tk.END).strip()
             if new_name and new_content:
-                message = self.manager.update_note(note_id, new_name, new_content)
-                messagebox.showinfo("Info", message)
-                edit_window.destroy()
-                self.list_notes()
+                def on_done(message):
+                    messagebox.showinfo("Info", message)
+                    edit_window.destroy()
+                    self.refresh_view()
+                self.run_db("update_note", note_id, new_name, new_content, on_done=on_done)
 
         save_button = ttk.Button(edit_window, text="Save", command=save_changes)
         save_button.pack(pady=10)
 
         def copy_note():
-            self.root.clipboard_clear()
-            self.root.clipboard_append(content_text.get("1.0", tk.END).strip())
-            self.show_auto_dismiss_dialog("Note content copied to clipboard!")
+            self.copy_to_clipboard(content_text.get("1.0", tk.END).strip())
 
         copy_button = ttk.Button(edit_window, text="Copy", command=copy_note)
         copy_button.pack(pady=5)
@@ -317,28 +2442,164 @@ class NoteApp:
         region = self.tree.identify_region(event.x, event.y)
         if region == "cell":
             column = self.tree.identify_column(event.x)
-            if column == "#4":  # Copy column
+            if column == "#5":  # Copy column
                 item = self.tree.identify_row(event.y)
-                note_content = self.tree.item(item, "values")[2]
-                self.root.clipboard_clear()
-                self.root.clipboard_append(note_content)
-                self.show_auto_dismiss_dialog("Note content copied to clipboard!")
+                note_id = self.tree.item(item, "values")[0]
+                self.with_note(note_id, lambda note: self.copy_to_clipboard(note[2]))
+
+    def copy_to_clipboard(self, content):
+        self.root.clipboard_clear()
+        self.root.clipboard_append(content)
+        self.show_auto_dismiss_dialog("Note content copied to clipboard!")
+
+    def show_diagnostics(self):
+        # Instrumentation stats, refreshed every second while the window is open. They are read
+        # straight from the manager rather than through the worker, so they stay up to date even
+        # while a slow call is holding the worker up.
+        manager = self.worker.manager
+        if manager is None or manager.instrumentation is None:
+            messagebox.showinfo("Diagnostics", "Instrumentation is off. Start the app with --instrument to record timings.")
+            return
+        diagnostics_window = self.themed(tk.Toplevel(self.root))
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("900x600")
+
+        method_columns = ("Method", "Calls", "Errors", "Rows", "p50 ms", "p95 ms", "Max ms")
+        methods_tree = ttk.Treeview(diagnostics_window, columns=method_columns, show="headings", height=8)
+        for column in method_columns:
+            methods_tree.heading(column, text=column)
+            methods_tree.column(column, width=200 if column == "Method" else 80, anchor="w" if column == "Method" else "e")
+        methods_tree.pack(padx=10, pady=5, fill=tk.X)
+
+        statement_columns = ("SQL", "Count", "Total ms", "Max ms")
+        statements_tree = ttk.Treeview(diagnostics_window, columns=statement_columns, show="headings", height=8)
+        for column in statement_columns:
+            statements_tree.heading(column, text=column)
+            statements_tree.column(column, width=560 if column == "SQL" else 90, anchor="w" if column == "SQL" else "e")
+        statements_tree.pack(padx=10, pady=5, fill=tk.X)
+
+        slow_text = self.themed(ScrolledText(diagnostics_window, height=10, font=("Courier", 9), wrap=tk.WORD))
+        slow_text.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+
+        shown_slow = [None]
+
+        def refresh():
+            if not diagnostics_window.winfo_exists():
+                return
+            diagnostics = manager.diagnostics()
+            methods_tree.delete(*methods_tree.get_children())
+            for name, stats in sorted(diagnostics["methods"].items(), key=lambda item: -item[1]["total_ms"]):
+                methods_tree.insert("", tk.END, values=(name, stats["calls"], stats["errors"], stats["rows"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"]))
+            statements_tree.delete(*statements_tree.get_children())
+            for sql, stats in diagnostics["statements"].items():
+                statements_tree.insert("", tk.END, values=(" ".join(sql.split())[:300], stats["count"], stats["total_ms"], stats["max_ms"]))
+            # Only rewritten when there is something new, so reading it isn't interrupted every second
+            if diagnostics["slow_queries"] != shown_slow:
+                shown_slow[:] = diagnostics["slow_queries"]
+                slow_text.delete("1.0", tk.END)
+                slow_text.insert("1.0", f"Statements over {diagnostics['slow_query_ms']:g} ms:\n\n" + "\n\n".join(
+                    f"{query['at']} {query['method']} {query['ms']} ms\n{' '.join(query['sql'].split())[:500]}\n  " + "\n  ".join(query["plan"])
+                    for query in reversed(diagnostics["slow_queries"])
+                ))
+            diagnostics_window.after(1000, refresh)
+
+        def save_stats():
+            path = filedialog.asksaveasfilename(parent=diagnostics_window, title="Save Diagnostics", defaultextension=".json", filetypes=[("JSON", "*.json")])
+            if path:
+                manager.dump_diagnostics(path)
+
+        save_button = ttk.Button(diagnostics_window, text="Save JSON...", command=save_stats)
+        save_button.pack(pady=5)
+        refresh()
 
     def show_auto_dismiss_dialog(self, message):
-        dialog = tk.Toplevel(self.root)
+        dialog = self.themed(tk.Toplevel(self.root))
         dialog.title("Info")
         dialog.geometry("300x50")
         dialog.attributes("-topmost", True)
-        dialog.configure(bg=self.theme_manager.get_theme()["bg"])
-        label = tk.Label(dialog, text=message, font=("Arial", 10), bg=self.theme_manager.get_theme()["bg"], fg=self.theme_manager.get_theme()["fg"])
+        label = ttk.Label(dialog, text=message)
         label.pack(pady=10)
         # Auto-dismiss after 2 seconds
         self.root.after(2000, dialog.destroy)
 
-def main():
-    root = tk.Tk()
-    app = NoteApp(root)
-    root.mainloop()
+def main(argv=None):
+    # With no command the GUI starts; the commands below run headless against the database
+    parser = argparse.ArgumentParser(description="Note Manager")
+    parser.add_argument("--db", default="notes.db", help="notes database (default: notes.db)")
+    parser.add_argument("--instrument", action="store_true", help="record method and SQL timings (see Diagnostics in the app)")
+    parser.add_argument("--slow-query-ms", type=float, default=100, help="statements at least this slow get a query plan (default: 100)")
+    parser.add_argument("--stats-file", help="write instrumentation stats as JSON here on exit (implies --instrument)")
+    parser.add_argument("--hot", action="store_true", help="serve the app's reads from an in-memory copy of the database")
+    parser.add_argument("--capture", action="store_true", help="start with clipboard capture on (a checkbox in the app)")
+    parser.add_argument("--capture-ms", type=int, default=200, help="clipboard poll interval while copies are coming in (default: 200)")
+    commands = parser.add_subparsers(dest="command")
+    compact_parser = commands.add_parser("compact", help="compress existing large notes and vacuum the database")
+    compact_parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    compact_parser.add_argument("--no-vacuum", action="store_true")
+    commands.add_parser("report", help="show storage per codec and read cost")
+    commands.add_parser("dedupe", help="hash notes saved before duplicate detection and merge exact duplicates")
+    commands.add_parser("drop-change-log", help="stop logging changes for hot copies (--hot) once none is in use; a later --hot run logs them again")
+    export_parser = commands.add_parser("export", help="stream every note to a JSONL or CSV file")
+    export_parser.add_argument("path", help="output file, or - for stdout")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the file extension, else jsonl")
+    import_parser = commands.add_parser("import", help="import a JSONL or CSV export, resuming where an interrupted import stopped")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the file extension, else jsonl")
+    import_parser.add_argument("--offset", type=int, help="start at this byte offset instead of the saved checkpoint")
+    import_parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start from the beginning")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.add_argument("--commit-every", type=int, default=10000, help="notes per transaction and checkpoint (default: 10000)")
+    import_parser.add_argument("--duplicates", choices=NoteManager.DUPLICATE_POLICIES, help="default: bump")
+    import_parser.add_argument(
+        "--no-trigram", action="store_true",
+        help="drop the substring index during the import and rebuild it once at the end; only with nothing else using the database",
+    )
+    args = parser.parse_args(argv)
+    instrument = {"instrument": args.instrument or bool(args.stats_file), "slow_query_ms": args.slow_query_ms}
+
+    if args.command is None:
+        root = tk.Tk()
+        app = NoteApp(root, args.db, stats_file=args.stats_file, hot=args.hot, capture=args.capture, capture_ms=args.capture_ms, **instrument)
+        root.mainloop()
+        return
+    if args.command == "compact":
+        manager = NoteManager(args.db, compression=args.codec, **instrument)
+        result = manager.compact(vacuum=not args.no_vacuum)
+        result["storage"] = manager.storage_report()
+    elif args.command == "report":
+        manager = NoteManager(args.db, **instrument)
+        result = manager.storage_report()
+    elif args.command == "dedupe":
+        manager = NoteManager(args.db, **instrument)
+        result = manager.dedupe()
+    elif args.command == "drop-change-log":
+        manager = NoteManager(args.db, **instrument)
+        result = {"dropped": manager.drop_change_log()}
+    elif args.command == "export":
+        manager = NoteManager(args.db, **instrument)
+        result = manager.export_notes(args.path, args.format)
+    elif args.command == "import":
+        manager = NoteManager(args.db, **instrument)
+
+        def show_progress(count, position, total_bytes, rate):
+            print(f"\r{count:,} notes, byte {position:,} of {total_bytes:,} ({rate:,.0f} notes/sec)", end="", file=sys.stderr, flush=True)
+
+        try:
+            result = manager.import_notes(
+                args.path, args.format, 0 if args.restart else args.offset, args.batch_size, args.commit_every, show_progress, args.duplicates,
+                trigram=not args.no_trigram,
+            )
+        except KeyboardInterrupt:
+            row = manager.conn.execute("SELECT offset FROM import_checkpoints WHERE path = ?", (os.path.abspath(args.path),)).fetchone()
+            print(f"\ninterrupted; run the same import again to resume from byte {row[0] if row else 0:,}", file=sys.stderr)
+            if args.no_trigram:
+                print("the substring index is rebuilt the next time the database is opened", file=sys.stderr)
+            return 130
+        print(file=sys.stderr)
+    # With the export on stdout, the summary goes to stderr
+    print(json.dumps(result, indent=2), file=sys.stderr if getattr(args, "path", None) == "-" else sys.stdout)
+    if args.stats_file:
+        manager.dump_diagnostics(args.stats_file)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
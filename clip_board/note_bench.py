@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from note6 import NoteManager
+
+# Benchmarks for NoteManager against deterministic synthetic corpora. Every run with the same seed
+# builds the same notes, so results from different machines or commits are comparable.
+#
+#   python note_bench.py --sizes 10k,100k --output results.json
+#   python note_bench.py --save-baseline               # store this run as the baseline
+#   python note_bench.py --baseline note_bench_baseline.json --tolerance 1.25
+#   python note_bench.py --hot --sizes 100k           # reads served from an in-memory copy
+#
+# With a baseline, operations whose p50 or p95 latency grew by more than the tolerance (and by at
+# least --min-delta-ms) are listed as regressions and the exit status is 1.
+#
+# note_bench_baseline.json, next to this file, is the baseline used by default: 10k and 100k notes,
+# taken on the machine described in its "meta" (Python, SQLite, platform). Latencies only compare
+# on like hardware, so on another machine save a baseline of your own (--save-baseline --baseline
+# mine.json) from the commit you start from and compare with --baseline mine.json. Regenerate the
+# committed one with --sizes 10k,100k --save-baseline when a change is meant to move the numbers,
+# or when the reference machine or its Python/SQLite changes. Operations timed over few calls
+# (list_notes) vary by up to 1.5x between runs on a busy machine; run again before trusting
+# a regression reported for one of them.
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "note_bench_baseline.json")
+
+WORDS = (
+    "error warning info debug request response timeout retry connection server client cluster index "
+    "query shard node alert policy lambda bucket deploy build release branch commit merge config "
+    "token session user account password proxy gateway route table column schema migration backup "
+    "metric latency throughput queue worker thread process memory cpu disk network packet header"
+).split()
+LEVELS = ("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR")
+COMMON_TERM = "error"
+# Planted in about one note in a thousand
+RARE_TERM = "zephyrquartz"
+# The rare term misspelled, for fuzzy search
+TYPO_TERM = "zephyrqaurtz"
+NO_HIT_TERM = "xylophonequasar"
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def log_paste(rng, size):
+    lines = []
+    total = 0
+    while total < size:
+        line = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z {rng.choice(LEVELS)} [{rng.choice(WORDS)}-{rng.randint(1, 64)}] {words(rng, rng.randint(6, 18))}"
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+def make_note(rng, number):
+    # Size mix of a clipboard history: mostly short snippets, some paragraphs and a tail of
+    # multi-KB log pastes. The number keeps every body distinct, so deduplication never drops one.
+    kind = rng.random()
+    if kind < 0.70:
+        body = words(rng, rng.randint(3, 40))
+    elif kind < 0.95:
+        body = "\n".join(words(rng, rng.randint(20, 60)) for _ in range(rng.randint(2, 8)))
+    else:
+        body = log_paste(rng, rng.randint(2_000, 16_000))
+    if rng.random() < 0.001:
+        body += " " + RARE_TERM
+    return f"{rng.choice(WORDS)} {rng.choice(WORDS)} {number}", f"{body}\n#{number}"
+
+def corpus(count, seed):
+    rng = random.Random(seed)
+    for number in range(count):
+        yield make_note(rng, number)
+
+def as_text(notes):
+    # The ===-delimited format load_notes_from_text reads: first line is the name
+    return "===".join(f"{name}\n{content}" for name, content in notes)
+
+def summarize(latencies, total=None):
+    # latencies in seconds, one per call
+    ordered = sorted(latencies)
+    total = sum(ordered) if total is None else total
+
+    def percentile(fraction):
+        return round(1000 * ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 3)
+
+    return {
+        "calls": len(ordered),
+        "total_s": round(total, 3),
+        "ops_per_sec": round(len(ordered) / total, 1) if total else None,
+        "mean_ms": round(1000 * statistics.fmean(ordered), 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(1000 * ordered[-1], 3),
+    }
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def bench_size(label, count, seed, workdir, repeat, batch_size, hot=False):
+    db_path = os.path.join(workdir, f"bench_{label}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    manager = NoteManager(db_path, hot=hot)
+    results = {}
+    rng = random.Random(seed + 1)
+
+    # Loading the corpus is itself the load_notes_from_text benchmark: one call per batch
+    latencies = []
+    batch = []
+    loaded = 0
+    for note in corpus(count, seed):
+        batch.append(note)
+        if len(batch) == batch_size:
+            latencies.append(timed(manager.load_notes_from_text, as_text(batch))[0])
+            loaded += len(batch)
+            batch.clear()
+    if batch:
+        latencies.append(timed(manager.load_notes_from_text, as_text(batch))[0])
+        loaded += len(batch)
+    results["load_notes_from_text"] = summarize(latencies)
+    results["load_notes_from_text"]["notes_per_sec"] = round(loaded / sum(latencies), 1)
+    results["database_bytes"] = manager.database_size()
+    if hot:
+        # The load outran the copy's change log, so it reloads; time that and read from it after
+        started = time.perf_counter()
+        manager.wait_until_hot()
+        results["hot_load_s"] = round(time.perf_counter() - started, 3)
+
+    # A handful of full listings; on large corpora each one reads every row
+    results["list_notes"] = summarize([timed(manager.list_notes)[0] for _ in range(max(repeat // 20, 3))])
+    results["list_notes_page"] = summarize([
+        timed(manager.list_notes_page, rng.randrange(count), 100)[0] for _ in range(repeat)
+    ])
+
+    for kind, term in (("common", COMMON_TERM), ("rare", RARE_TERM), ("typo", TYPO_TERM), ("no_hit", NO_HIT_TERM)):
+        for mode in ("auto", "substring", "fuzzy"):
+            latencies = []
+            rows = 0
+            for _ in range(repeat):
+                elapsed, found = timed(manager.search_notes, term, mode)
+                latencies.append(elapsed)
+                rows = len(found)
+            results[f"search_notes[{kind},{mode}]"] = {**summarize(latencies), "rows": rows}
+
+    # Mutations last, on ids spread over the whole table
+    ids = [row[0] for row in manager.conn.execute("SELECT id FROM notes ORDER BY random() LIMIT ?", (2 * repeat,))]
+    extra = corpus(repeat, seed + 2)
+    results["add_note"] = summarize([timed(manager.add_note, name, content + " added")[0] for name, content in extra])
+    results["update_note"] = summarize([
+        timed(manager.update_note, note_id, f"updated {note_id}", make_note(rng, count + note_id)[1])[0]
+        for note_id in ids[:repeat]
+    ])
+    results["delete_note_by_id"] = summarize([timed(manager.delete_note_by_id, note_id)[0] for note_id in ids[repeat:]])
+
+    manager.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return results
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    # Operations whose p50 or p95 got slower than baseline * tolerance, ignoring differences of
+    # under min_delta_ms that are timer and scheduler noise on fast calls
+    regressions = []
+    for label, operations in results["sizes"].items():
+        for operation, stats in operations.items():
+            before = baseline.get("sizes", {}).get(label, {}).get(operation)
+            if not isinstance(stats, dict) or not isinstance(before, dict):
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                if before.get(key) and stats[key] > before[key] * tolerance and stats[key] - before[key] >= min_delta_ms:
+                    regressions.append({
+                        "size": label, "operation": operation, "metric": key,
+                        "baseline": before[key], "current": stats[key], "ratio": round(stats[key] / before[key], 2),
+                    })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NoteManager on synthetic corpora")
+    parser.add_argument("--sizes", default="10k,100k,1m", help=f"comma-separated corpus sizes from {', '.join(SIZES)} (default: all)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--repeat", type=int, default=200, help="calls per timed operation (default: 200)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="notes per load_notes_from_text call (default: 1000)")
+    parser.add_argument("--workdir", default=None, help="where the benchmark databases are built (default: a temp directory)")
+    parser.add_argument("--output", default=None, help="write results as JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help=f"compare against this results file (default: {os.path.basename(DEFAULT_BASELINE)} if present)")
+    parser.add_argument("--hot", action="store_true", help="serve reads from an in-memory copy (NoteManager hot=True)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as a regression (default: 1.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="smallest slowdown in ms reported as a regression (default: 1.0)")
+    args = parser.parse_args(argv)
+
+    labels = [label.strip().lower() for label in args.sizes.split(",") if label.strip()]
+    unknown = [label for label in labels if label not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    results = {
+        "meta": {
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "batch_size": args.batch_size,
+            "hot": args.hot,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tempdir:
+        for label in labels:
+            print(f"benchmarking {label} notes...", file=sys.stderr)
+            results["sizes"][label] = bench_size(label, SIZES[label], args.seed, args.workdir or tempdir, args.repeat, args.batch_size, args.hot)
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None)
+    if baseline_path and not args.save_baseline:
+        with open(baseline_path, encoding="utf-8") as baseline_file:
+            results["regressions"] = compare(results, json.load(baseline_file), args.tolerance, args.min_delta_ms)
+        results["baseline"] = baseline_path
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.baseline or DEFAULT_BASELINE, "w", encoding="utf-8") as baseline_file:
+            baseline_file.write(output + "\n")
+    for regression in results.get("regressions", []):
+        print(f"REGRESSION {regression['size']} {regression['operation']} {regression['metric']}: "
+              f"{regression['baseline']} -> {regression['current']} ms (x{regression['ratio']})", file=sys.stderr)
+    return 1 if results.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Tests for note6's NoteManager, on a database in a temporary directory:
+
+    python test_note6.py
+    python -m pytest test_note6.py
+"""
+import os
+import tempfile
+import unittest
+
+from note6 import NoteManager
+
+
+class FtsQueryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.manager = NoteManager(os.path.join(directory.name, "notes.db"))
+        self.addCleanup(self.manager.close)
+        if not self.manager.fts_enabled:
+            self.skipTest("SQLite built without FTS5")
+        self.manager.add_note("hello", "greetings to everyone")
+        self.manager.add_note("meeting", "hello at 10:30 in room 4")
+        self.manager.add_note("links", "see http://host.example/hello for hello details")
+
+    def search(self, query):
+        return sorted(row[1] for row in self.manager.search_notes(query, mode="fts"))
+
+    def test_plain_terms_become_prefix_phrases(self):
+        self.assertEqual(self.manager.fts_query('hel 10:30'), '"hel"* "10:30"*')
+        self.assertEqual(self.search("hel"), ["hello", "links", "meeting"])
+        # A colon that isn't a column filter stays part of a plain term
+        self.assertEqual(self.search("10:30"), ["meeting"])
+        self.assertEqual(self.search("http://host"), ["links"])
+
+    def test_column_filters_pass_through(self):
+        for query in ("name:hello", "name : hello", "{name content}: hello", "content:greetings", "-content:hello", "^hello", "name:^mee"):
+            with self.subTest(query=query):
+                self.assertEqual(self.manager.fts_query(query), query)
+        self.assertEqual(self.search("name:hello"), ["hello"])
+        self.assertEqual(self.search("content:hello"), ["links", "meeting"])
+        self.assertEqual(self.search("{name content}: greetings"), ["hello"])
+        # "- column:" looks for the phrase in every other column
+        self.assertEqual(self.search("- name: hello"), ["links", "meeting"])
+
+    def test_initial_token(self):
+        self.assertEqual(self.search("content:^hello"), ["meeting"])
+        self.assertEqual(self.search("name:^mee*"), ["meeting"])
+
+    def test_operators_pass_through(self):
+        self.assertEqual(self.search("greetings OR room"), ["hello", "meeting"])
+        self.assertEqual(self.search('"hello at"'), ["meeting"])
+
+
+if __name__ == "__main__":
+    unittest.main()